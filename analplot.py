@@ -7,10 +7,31 @@
 import numpy as np
 from helpers import *
 import sys
+import os
+import collections
+import hashlib
+import time
 
 
 
 DATAOPSCHAINER='>'
+# Fuse consecutive elementwise/per col affine dataOps in a chain into one kernel
+bFUSE_DATAOPS=True
+# Default memory budget (in bytes) of the AnalPlot.data cache, None means no limit
+DATACACHE_MAXBYTES=None
+# Default dir to persist the dataOps results across runs, None means dont persist
+DISKCACHE_DIR=None
+# Limits of the disk cache, enforced by set_disk_cache, None means no limit
+# Max total size (in bytes) of the disk cache
+DISKCACHE_MAXBYTES=1024*1024*1024
+# Max age (in secs) of the disk cache entries, since they were last saved or loaded
+DISKCACHE_MAXAGE=30*24*60*60
+# Push the col selection of get_data_selective down the dataOps chain
+bPUSHDOWN_SELCOLS=True
+# Max num of col projections kept by an AnalPlot instance, see _get_data_pushdown
+PUSHDOWN_MAXPROJECTIONS=8
+# Memo of the parsed dataOp strings, see AnalPlot._parse_funcstr
+_dPARSEDFUNCSTRS={}
 
 DBG_PLOTXYRECT_MSG=False
 DBG_TEXTXY=False
@@ -51,6 +72,124 @@ def textxy_spread(mode="default", mult=1):
 
 
 
+class DataCache(dict):
+    """ A dict, used as AnalPlot.data, which tracks the size and last access of
+        each dataset (ie dataKey along with its ColHdr and RowHdr) in it. If a
+        maxBytes budget is set, then once the total size goes beyond it, the least
+        recently used datasets, which can be evicted, are removed.
+
+        Pinned datasets (the raw ones) are never evicted. fnCanEvict(dataKey) is
+        used to check if a dataset can be evicted (ie recalculated later) and
+        fnOnEvict(dataKey) is called after a dataset is evicted.
+        """
+
+    lHdrSuffixes = [ "ColHdr", "RowHdr" ]
+
+    def __init__(self, maxBytes=None, fnCanEvict=None, fnOnEvict=None):
+        super().__init__()
+        self.maxBytes = maxBytes
+        self.fnCanEvict = fnCanEvict
+        self.fnOnEvict = fnOnEvict
+        self.dSizes = {}
+        self.curBytes = 0
+        self.dLRU = collections.OrderedDict()
+        self.sPinned = set()
+
+
+    def _dataset_key(self, key):
+        """ The dataKey of the dataset, to which the given key belongs
+            """
+        for sSuffix in self.lHdrSuffixes:
+            if key.endswith(sSuffix):
+                return key[:-len(sSuffix)]
+        return key
+
+
+    def _touch(self, key):
+        sDKey = self._dataset_key(key)
+        self.dLRU[sDKey] = True
+        self.dLRU.move_to_end(sDKey)
+
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self._touch(key)
+        return value
+
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._forget(key)
+        super().__setitem__(key, value)
+        iSize = getattr(value, "nbytes", 0)
+        self.dSizes[key] = iSize
+        self.curBytes += iSize
+        self._touch(key)
+        self.evict()
+
+
+    def _forget(self, key):
+        self.curBytes -= self.dSizes.pop(key, 0)
+
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._forget(key)
+        self._drop_lru(key)
+
+
+    def pop(self, key, *args):
+        bIn = key in self
+        value = super().pop(key, *args)
+        if bIn:
+            self._forget(key)
+            self._drop_lru(key)
+        return value
+
+
+    def _drop_lru(self, key):
+        sDKey = self._dataset_key(key)
+        if (sDKey not in self) and (sDKey+"ColHdr" not in self) and (sDKey+"RowHdr" not in self):
+            self.dLRU.pop(sDKey, None)
+            self.sPinned.discard(sDKey)
+
+
+    def pin(self, dataKey):
+        """ Never evict the given dataset
+            """
+        self.sPinned.add(dataKey)
+
+
+    def dataset_bytes(self, dataKey):
+        iSize = self.dSizes.get(dataKey, 0)
+        for sSuffix in self.lHdrSuffixes:
+            iSize += self.dSizes.get(dataKey+sSuffix, 0)
+        return iSize
+
+
+    def evict(self):
+        """ Evict the least recently used datasets, till the total size is within
+            the budget. The most recently used dataset is never evicted.
+            """
+        if (self.maxBytes == None) or (self.curBytes <= self.maxBytes):
+            return
+        lKeys = list(self.dLRU.keys())[:-1]
+        for sDKey in lKeys:
+            if self.curBytes <= self.maxBytes:
+                break
+            if sDKey in self.sPinned:
+                continue
+            if (self.fnCanEvict != None) and (not self.fnCanEvict(sDKey)):
+                continue
+            dprint("DBUG:DataCache:evict:%s:%d bytes"%(sDKey, self.dataset_bytes(sDKey)))
+            for key in [ sDKey ] + [ sDKey+sSuffix for sSuffix in self.lHdrSuffixes ]:
+                if key in self:
+                    self.pop(key)
+            if self.fnOnEvict != None:
+                self.fnOnEvict(sDKey)
+
+
+
 class AnalPlot:
     """ AnalPlot allows one to store, process and plot datasets in multiple ways.
 
@@ -76,6 +215,24 @@ class AnalPlot:
         dataKey (which follows the dataOpsChaining notation). By default it eats
         memory to gain on processing ;-)
 
+        If a memory budget is set (maxCacheBytes or set_cache_budget), then the
+        least recently used derived datasets are evicted, once the cached data
+        goes beyond the budget. The raw datasets (set_raw) and datasets, which
+        cant be recalculated using their dataKey (like those stored by calling
+        the calc_????? functions directly), are never evicted. The evicted
+        datasets are transparently recalculated by get_data, when needed again.
+
+        The raw data and the results of the data operations are stored as per the
+        dtype policy (see helpers.set_dtype_policy). In "compact" mode, float data
+        is stored as float32 and int data as int32, which halves the memory used.
+        diff and cumsum of int data retain int dtype.
+
+        If a disk cache dir is set (diskCacheDir or set_disk_cache), then the
+        datasets calculated by get_data are also saved into it, keyed by a hash
+        of the raw dataset they are derived from and their dataOps chain. A later
+        run (or AnalPlot instance) working on the same raw data, loads them from
+        there (memory mapped) instead of calculating them again.
+
         Implementation Note:
         get_data and inturn auto calc logic path checks if data is already available
         before triggering a data operation to generate the data if required. However
@@ -85,12 +242,84 @@ class AnalPlot:
         """
 
 
-    def __init__(self):
+    def __init__(self, maxCacheBytes=None, diskCacheDir=None):
         """ Initialise a new instance of AnalPlot class
+            maxCacheBytes: the memory budget for the cached data. If None, then
+                DATACACHE_MAXBYTES is used.
+            diskCacheDir: the dir to persist the calculated data into. If None,
+                then DISKCACHE_DIR is used.
             """
+        if maxCacheBytes == None:
+            maxCacheBytes = DATACACHE_MAXBYTES
+        if diskCacheDir == None:
+            diskCacheDir = DISKCACHE_DIR
+        self.maxCacheBytes = maxCacheBytes
+        self.set_disk_cache(diskCacheDir)
+        # Memo of the canonical form of dataKeys, see canonical_datakey
+        self.dCanonKeys = {}
         self.new_dataset()
 
 
+    def set_cache_budget(self, maxCacheBytes=None):
+        """ Set the memory budget (in bytes) for the cached data, None for no limit
+            """
+        self.maxCacheBytes = maxCacheBytes
+        self.data.maxBytes = maxCacheBytes
+        self.data.evict()
+        self._evict_projections()
+
+
+    def set_disk_cache(self, diskCacheDir=None):
+        """ Set the dir to persist the calculated data into, None to not persist
+            The entries in the dir, which are older than DISKCACHE_MAXAGE secs
+            (since they were last saved or loaded) are removed, as well as the
+            oldest entries beyond a total size of DISKCACHE_MAXBYTES.
+            """
+        if diskCacheDir != None:
+            os.makedirs(diskCacheDir, exist_ok=True)
+        self.diskCacheDir = diskCacheDir
+        if diskCacheDir != None:
+            self._diskcache_prune(DISKCACHE_MAXBYTES, DISKCACHE_MAXAGE)
+
+
+    def _diskcache_prune(self, maxBytes=None, maxAge=None):
+        """ Remove the disk cache entries (data and headers files), which are
+            older than maxAge secs and the oldest ones beyond maxBytes in total.
+            """
+        dEntries = {}
+        for sFile in os.listdir(self.diskCacheDir):
+            if sFile.endswith(".hdr.npz"):
+                sEntry = sFile[:-len(".hdr.npz")]
+            elif sFile.endswith(".npy") or sFile.endswith(".tmp"):
+                sEntry = sFile.split(".",1)[0]
+            else:
+                continue
+            sPath = os.path.join(self.diskCacheDir, sFile)
+            try:
+                st = os.stat(sPath)
+            except OSError:
+                continue
+            lEntry = dEntries.setdefault(sEntry, [0, 0, []])
+            lEntry[0] = max(lEntry[0], st.st_mtime)
+            lEntry[1] += st.st_size
+            lEntry[2].append(sPath)
+        lEntries = sorted(dEntries.values(), key=lambda x: x[0], reverse=True)
+        iBytes = 0
+        tNow = time.time()
+        lRemove = []
+        for lEntry in lEntries:
+            iBytes += lEntry[1]
+            if ((maxAge != None) and ((tNow - lEntry[0]) > maxAge)) or ((maxBytes != None) and (iBytes > maxBytes)):
+                lRemove.extend(lEntry[2])
+        for sPath in lRemove:
+            try:
+                os.remove(sPath)
+            except OSError as e:
+                print("WARN:AnalPlot:DiskCache:Prune:%s:%s"%(sPath, e))
+        if len(lRemove) > 0:
+            dprint("DBUG:AnalPlot:DiskCache:Pruned:%d files"%(len(lRemove)))
+
+
     def _get_datakeys(self, dataKey="raw"):
         """ get the datakeys required to access a given data
             and its associated column and row headers
@@ -116,11 +345,120 @@ class AnalPlot:
             a new set of data. THis automatically clears any
             prev data that may be stored by this instance.
             """
-        self.data = {}
+        self.data = DataCache(self.maxCacheBytes, self._can_evict, self._on_evict)
+        # Cache of the cols/rows with a given val masks, see _withval_mask
+        self.dValMasks = {}
+        # The derivation graph of the datasets, see _add_derived
+        self.dDerived = {}
+        self.dDerivedFrom = {}
+        # The hashes of the raw datasets, see _raw_hash
+        self.dRawHashes = {}
+        # The col projections of datasets, see _get_data_pushdown
+        self.dProjections = collections.OrderedDict()
+        # The datasets calculated as per their own dataKey, see _datakey_root
+        self.sRecipeKeys = set()
+        # The temporary raw datasets, whose derived data isnt persisted, see set_raw
+        self.sTempRaws = set()
         self._initdbg_axisadjust()
 
 
-    def set_raw(self, data, rowHdr=None, colHdr=None, dataKey="raw", skipRowsTop=0, skipRowsBottom=-1, skipColsLeft=0, skipColsRight=-1):
+    def _datakey_root(self, dataKey):
+        """ Return the pinned (raw) dataset from which the given dataKey can be
+            calculated using its dataKey DataOpsChaining notation, else None.
+
+            A dataKey is trusted to be the recipe of its data, only if get_data
+            calculated it from its dataKey (ie it is in sRecipeKeys). Datasets
+            stored by calling calc_????? functions directly may have used args
+            (say axis=1 for scale), which arent part of their auto generated
+            dataKey, so neither they nor the datasets derived from them (as per
+            the dataKey chain) are treated as recalculatable.
+            """
+        sKey = dataKey
+        while sKey not in self.data.sPinned:
+            if DATAOPSCHAINER not in sKey:
+                return None
+            if (sKey in self.data) and (sKey not in self.sRecipeKeys):
+                return None
+            [sBDKey, sCmd] = sKey.rsplit(DATAOPSCHAINER,1)
+            if sCmd not in self.dCalcSimpleFuncs:
+                sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
+                if sFName == None:
+                    return None
+            sKey = sBDKey
+        return sKey
+
+
+    def _can_evict(self, dataKey):
+        """ A dataset can be evicted, only if it can be recalculated from a pinned
+            (raw) dataset using its dataKey (in dataKey DataOpsChaining notation).
+            """
+        return self._datakey_root(dataKey) != None
+
+
+    def _on_evict(self, dataKey):
+        self.sRecipeKeys.discard(dataKey)
+        for tKey in list(self.dValMasks.keys()):
+            if tKey[0] == dataKey:
+                self.dValMasks.pop(tKey)
+
+
+    def _add_derived(self, inDataKey, outDataKey):
+        """ Record that the dataset outDataKey is derived from the dataset inDataKey.
+            dDerived maps each dataset to the datasets directly derived from it and
+            dDerivedFrom maps the other way. del_data uses these to find all the
+            datasets derived from a dataset, without depending on their names.
+            """
+        if inDataKey == outDataKey:
+            return
+        self.dDerived.setdefault(inDataKey, set()).add(outDataKey)
+        self.dDerivedFrom.setdefault(outDataKey, set()).add(inDataKey)
+
+
+    def _get_derived(self, dataKey):
+        """ Return all the datasets derived directly or indirectly from dataKey
+            """
+        lDerived = []
+        sSeen = set([ dataKey ])
+        lPending = [ dataKey ]
+        while len(lPending) > 0:
+            for sChild in self.dDerived.get(lPending.pop(), ()):
+                if sChild not in sSeen:
+                    sSeen.add(sChild)
+                    lDerived.append(sChild)
+                    lPending.append(sChild)
+        return lDerived
+
+
+    def _forget_derived(self, dataKey):
+        """ Remove dataKey from the derivation graph
+            """
+        for sParent in self.dDerivedFrom.pop(dataKey, ()):
+            sChildren = self.dDerived.get(sParent)
+            if sChildren != None:
+                sChildren.discard(dataKey)
+                if len(sChildren) == 0:
+                    self.dDerived.pop(sParent)
+        for sChild in self.dDerived.pop(dataKey, ()):
+            sParents = self.dDerivedFrom.get(sChild)
+            if sParents != None:
+                sParents.discard(dataKey)
+                if len(sParents) == 0:
+                    self.dDerivedFrom.pop(sChild)
+
+
+    def _del_derived(self, dataKey):
+        """ Remove all the datasets derived from dataKey, along with their headers
+            """
+        lDerived = self._get_derived(dataKey)
+        for sKey in lDerived:
+            for key in self._get_datakeys(sKey):
+                self.data.pop(key, None)
+            self._forget_derived(sKey)
+            self.sRecipeKeys.discard(sKey)
+        return lDerived
+
+
+    def set_raw(self, data, rowHdr=None, colHdr=None, dataKey="raw", skipRowsTop=0, skipRowsBottom=-1, skipColsLeft=0, skipColsRight=-1, bTemp=False):
         """ Store new raw data along with given row header and col header
             data: the new raw data to store
             colHdr: the associated column | field header
@@ -135,11 +473,27 @@ class AnalPlot:
 
             NOTE: If no col and row header is specified and if data is
             only 1 dimensional, it is reshaped to be 2D data of 1xSize
+
+            NOTE: If dataKey already has data, then the datasets derived
+            from it are removed, as they no longer correspond to it.
+
+            bTemp: If True, this is scratch data (say used internally by a plot
+                helper for a short while), so the datasets derived from it are
+                not saved into the disk cache.
             """
         if (data.ndim == 1) and (rowHdr == None) and (colHdr == None):
             data = data.reshape(1,data.shape[0])
         sDKey, sCHKey, sRHKey = self._get_datakeys(dataKey)
-        self.data[sDKey] = data
+        if sDKey in self.dDerived:
+            self._del_derived(sDKey)
+            self._prune_valmasks()
+        self.sRecipeKeys.discard(sDKey)
+        if bTemp:
+            self.sTempRaws.add(sDKey)
+        else:
+            self.sTempRaws.discard(sDKey)
+        self.data.pin(sDKey)
+        self.data[sDKey] = store_array(data, bIntIfIntegral=True)
         if type(rowHdr) == type(None):
             rowHdr = np.arange(data.shape[0])
         if type(colHdr) == type(None):
@@ -152,6 +506,152 @@ class AnalPlot:
         self.data[sCHKey] = colHdr
 
 
+    def _append_ctx(self, sParent, sChild):
+        """ Find how the dataset sChild can be extended, when new rows are added
+            to its parent dataset sParent. Returns
+                (numCtxRows, bCumSum, indexDelta): the new rows of sChild are got by
+                    applying its dataOps (the part of its dataKey after sParent) on the
+                    new rows of sParent along with numCtxRows rows before them. If
+                    bCumSum, then the last row of sChild is added to them. If indexDelta
+                    is not None, the row header is trimmed like movavg does.
+                None: if sChild can only be recalculated fully.
+
+            dataOps which work on each row independently (log10 and the axis=1 ones)
+            need no context rows, diff needs 1 row and movavg (W-1)*T rows. cumsum
+            continues from its last row. The other axis=0 dataOps (scale, rel2sum,
+            rel2mean) depend on the full col, so they cant be extended.
+            """
+        if not sChild.startswith(sParent+DATAOPSCHAINER):
+            return None
+        lCmds = sChild[len(sParent)+1:].split(DATAOPSCHAINER)
+        lOps = []
+        for sCmd in lCmds:
+            sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
+            if sFName == None:
+                return None
+            if sFName == "movavg":
+                windowSize, times, axis = self._movavg_args(lArgNames, lArgVals)
+            elif sFName == "log10":
+                axis = 1
+            else:
+                axis = self._dataop_axis(sFName, lArgNames, lArgVals)
+            lOps.append((sFName, axis))
+        if all([ x[1] == 1 for x in lOps ]):
+            return 0, False, None
+        if len(lOps) > 1:
+            return None
+        sFName, axis = lOps[0]
+        if sFName == "cumsum":
+            return 0, True, None
+        if sFName == "diff":
+            return 1, False, None
+        if sFName == "movavg":
+            return (windowSize-1)*times, False, int(((windowSize-1)*times)/2)
+        return None
+
+
+    def _drop_stale(self, dataKey):
+        """ Drop a dataset, which is no longer in sync with the data it is derived
+            from. If it can be recalculated using its dataKey, then get_data will
+            do so lazily when it is needed, else it is removed along with its
+            derivation info and the datasets derived from it.
+            Returns the list of datasets derived from it, which were removed.
+            """
+        bRecalc = self._can_evict(dataKey)
+        for key in self._get_datakeys(dataKey):
+            self.data.pop(key, None)
+        if bRecalc:
+            return []
+        print("WARN:AnalPlot:append_rows:Removing %s, as it cant be recalculated"%(dataKey))
+        lDerived = self._del_derived(dataKey)
+        self._forget_derived(dataKey)
+        self.sRecipeKeys.discard(dataKey)
+        return lDerived
+
+
+    def append_rows(self, data, rowHdr=None, dataKey="raw"):
+        """ Append new rows to the given dataset (normally a raw dataset) and
+            update the datasets derived from it, by calculating only their new
+            rows (see _append_ctx), rather than recalculating them fully.
+            data: the new rows, with the same number of cols as the dataset
+            rowHdr: the row header of the new rows. If None, the numerical
+                row header is continued.
+
+            Derived datasets which cant be extended (like scale, rel2sum or
+            rel2mean along axis=0) and the datasets derived from them, are
+            dropped and recalculated lazily by get_data, when they are needed.
+            Only datasets which get_data calculated as per their dataKey are
+            extended or recalculated, the others (like those stored by calling
+            calc_????? functions directly) are removed.
+
+            Returns the list of dropped dataKeys.
+            """
+        dataKey = self._resolve_datakey(dataKey)
+        if data.ndim == 1:
+            data = data.reshape(1,data.shape[0])
+        sDKey, sCHKey, sRHKey = self._get_datakeys(dataKey)
+        d, dCH, dRH = self._get_data(dataKey)
+        if type(rowHdr) == type(None):
+            rowHdr = np.arange(len(dRH), len(dRH)+data.shape[0])
+        dNumRows = { sDKey: d.shape[0] }
+        self.data[sDKey] = store_array(np.concatenate((d, data)), bIntIfIntegral=True)
+        self.data[sRHKey] = np.concatenate((dRH, np.asarray(rowHdr)))
+        lDropped = []
+        lPending = [ sDKey ]
+        while len(lPending) > 0:
+            sParent = lPending.pop(0)
+            for sChild in sorted(self.dDerived.get(sParent, ())):
+                if (sChild in dNumRows) or (sChild in lDropped):
+                    continue
+                tCtx = None
+                if (sParent in dNumRows) and (sParent in self.data) and (len(self.dDerivedFrom.get(sChild, ())) == 1):
+                    tCtx = self._append_ctx(sParent, sChild)
+                if sChild not in self.data:
+                    # Evicted, get_data will recalculate it fully when needed
+                    tCtx = None
+                elif sChild not in self.sRecipeKeys:
+                    # Its dataKey may not reflect the args used to calculate it
+                    tCtx = None
+                elif (tCtx != None) and (dNumRows[sParent] < max(tCtx[0],1)):
+                    tCtx = None
+                if tCtx == None:
+                    lDropped.append(sChild)
+                    lDropped.extend(self._drop_stale(sChild))
+                    lPending.append(sChild)
+                    continue
+                numCtxRows, bCumSum, indexDelta = tCtx
+                dP, dPCH, dPRH = self._get_data(sParent)
+                dC, dCCH, dCRH = self._get_data(sChild)
+                iStart = dNumRows[sParent] - numCtxRows
+                tAP = self._scratch_analplot(dP[iStart:], dPCH, dPRH[iStart:], "new")
+                dNew, dNewCH, dNewRH = tAP.get_data("new"+sChild[len(sParent):])
+                if bCumSum:
+                    dNew = dNew + dC[-1]
+                dNumRows[sChild] = dC.shape[0]
+                newDKey, newCHKey, newRHKey = self._get_datakeys(sChild)
+                self.data[newDKey] = store_array(np.concatenate((dC, dNew)))
+                if indexDelta != None:
+                    self.data[newRHKey] = dPRH[indexDelta:-indexDelta]
+                else:
+                    self.data[newRHKey] = np.concatenate((dCRH, dNewRH))
+                lPending.append(sChild)
+        self._prune_valmasks()
+        dprint("DBUG:AnalPlot:append_rows:%s:%d rows, dropped %s"%(dataKey, data.shape[0], lDropped))
+        return lDropped
+
+
+    def _scratch_analplot(self, d, dCH, dRH, dataKey):
+        """ Return a new AnalPlot instance (without disk cache) with the given
+            data as its raw dataset. The data is stored as is, so that dataOps
+            applied on it match those applied on the dataset it was taken from.
+            """
+        tAP = AnalPlot(self.maxCacheBytes)
+        tAP.set_disk_cache(None)
+        tAP.set_raw(d, dRH, dCH, dataKey=dataKey)
+        tAP.data[dataKey] = d
+        return tAP
+
+
     def _get_data(self, dataKey="raw"):
         """ Return the specified data and its col and row headers
             """
@@ -170,20 +670,119 @@ class AnalPlot:
                 corresponding to each col in the dataset.
                 Cols with True corresponding to their position,
                 will be selected to be returned.
+
+            If bPUSHDOWN_SELCOLS and the data is not yet available, then the
+            col selection is pushed down the dataOps chain, when possible
+            (see _get_data_pushdown), so that only the selected cols are
+            calculated.
             """
-        d, dCH, dRH = self.get_data(dataKey)
-        tD = d
-        tDCH = dCH
-        tDRH = dRH
-        if type(selCols) != type(None):
-            tD = tD[:,selCols]
-            tDCH = tDCH[selCols]
+        dataKey = self._resolve_datakey(dataKey)
+        tD = None
+        if (type(selCols) != type(None)) and bPUSHDOWN_SELCOLS:
+            tD, tDCH, tDRH = self._get_data_pushdown(dataKey, selCols)
+        if type(tD) == type(None):
+            d, dCH, dRH = self.get_data(dataKey)
+            tD = d
+            tDCH = dCH
+            tDRH = dRH
+            if type(selCols) != type(None):
+                tD = tD[:,selCols]
+                tDCH = tDCH[selCols]
         if type(selRows) != type(None):
             tD = tD[selRows,:]
             tDRH = tDRH[selRows]
         return tD, tDCH, tDRH
 
 
+    def _is_colwise(self, sFName, lArgNames, lArgVals):
+        """ Check if the given dataOp works on each col independently, ie its
+            result for a col depends only on that col of its input data.
+            log10 works on each value and the others do so, if axis is 0.
+            """
+        if sFName not in self.dDataOpArgs:
+            return False
+        if sFName == "movavg":
+            windowSize, times, axis = self._movavg_args(lArgNames, lArgVals)
+            return axis == 0
+        for sArg, sVal in zip(lArgNames, lArgVals):
+            if (sArg in [ "axis", "A" ]) and (int(sVal) != 0):
+                return False
+        return True
+
+
+    def _get_data_pushdown(self, dataKey, selCols):
+        """ Calculate the given dataKey only for the selected cols, by applying
+            its dataOps chain on the selected cols of the longest already available
+            part of the chain. This is possible only if all the remaining dataOps
+            work on each col independently. Ops which need the full row (like
+            rel2sum(A=1) or scale(A=1) or any other axis=1 dataOp) block this.
+
+            The projected datasets are kept in a separate AnalPlot instance per
+            base dataset and selCols, so that the intermediate results are reused
+            across calls, without getting mixed with the full datasets. These are
+            bounded, see _evict_projections.
+
+            Returns None, None, None if the data is already available (including
+            in the disk cache) or the col selection cant be pushed down.
+            """
+        dataKey = self.canonical_datakey(dataKey)
+        if dataKey in self.data:
+            return None, None, None
+        if (self.diskCacheDir != None) and self._diskcache_load(dataKey):
+            return None, None, None
+        sBase = self._pushdown_base(dataKey)
+        if sBase == None:
+            return None, None, None
+        tAP = self._projection(sBase, selCols)
+        dprint("DBUG:AnalPlot:get_data_pushdown:%s:from %s:%d of %d cols"%(dataKey, sBase, tAP.data["sel"].shape[1], self.data[sBase].shape[1]))
+        tRet = tAP.get_data("sel"+dataKey[len(sBase):])
+        self._evict_projections()
+        return tRet
+
+
+    def _pushdown_base(self, dataKey):
+        """ Return the longest already available part of the given (canonical)
+            dataKey, if all the remaining dataOps of its chain work on each col
+            independently, else None.
+            """
+        sBase, lOps = self._plan_datakey(dataKey)
+        if (lOps == None) or (len(lOps) == 0):
+            return None
+        for sFName, lArgNames, lArgVals, sOpKey in lOps:
+            if not self._is_colwise(sFName, lArgNames, lArgVals):
+                return None
+        return sBase
+
+
+    def _projection(self, sBase, selCols):
+        """ Return the AnalPlot instance holding the selected cols of the given
+            base dataset (as its "sel" dataKey), creating it if required.
+            """
+        dBase, dBaseCH, dBaseRH = self._get_data(sBase)
+        aSel = np.asarray(selCols)
+        tKey = (sBase, aSel.dtype.str, aSel.tobytes())
+        tProj = self.dProjections.get(tKey)
+        if (tProj == None) or (tProj[0] is not dBase):
+            tAP = self._scratch_analplot(dBase[:,aSel], dBaseCH[aSel], dBaseRH, "sel")
+            tProj = (dBase, tAP)
+            self.dProjections[tKey] = tProj
+        self.dProjections.move_to_end(tKey)
+        return tProj[1]
+
+
+    def _evict_projections(self):
+        """ Drop the least recently used col projections, if there are more than
+            PUSHDOWN_MAXPROJECTIONS of them or if the full and projected cached data
+            together go beyond the cache budget (maxCacheBytes). The most recently
+            used projection is retained.
+            """
+        while len(self.dProjections) > 1:
+            iBytes = self.data.curBytes + sum([ x[1].data.curBytes for x in self.dProjections.values() ])
+            if (len(self.dProjections) <= PUSHDOWN_MAXPROJECTIONS) and ((self.maxCacheBytes == None) or (iBytes <= self.maxCacheBytes)):
+                break
+            self.dProjections.popitem(last=False)
+
+
     def print_data_selective(self, dataKey="raw", selCols=None):
         tD, tDCH, dRH = self.get_data_selective(dataKey, selCols)
         print("DBUG:AnalPlot:print_data:%s:%s"%(dataKey, selCols))
@@ -191,31 +790,55 @@ class AnalPlot:
         print("DBUG:AnalPlot:print_data:Data:\n",tD)
 
 
+    def _withval_mask(self, dataKey="raw", val=0, axis=0):
+        """ Return a bool mask of the cols (axis=0) or rows (axis=1), which
+            contain the given val in all their rows or cols respectively.
+
+            The mask is cached along with the dataset it was calculated for,
+            and reused as long as the dataset is not replaced.
+            """
+        dataKey = self._resolve_datakey(dataKey)
+        d, dCH, dRH = self.get_data(dataKey)
+        tKey = (dataKey, val, axis)
+        if tKey in self.dValMasks:
+            dCached, mask = self.dValMasks[tKey]
+            if dCached is d:
+                return mask
+        mask = np.all(d == val, axis=axis)
+        self.dValMasks[tKey] = (d, mask)
+        return mask
+
+
     def get_cols_withval(self, dataKey="raw", val = 0):
         """ Find cols which contain the given val in all its rows
             """
-        d, dCH, dRH = self.get_data(dataKey)
-        #d = self.data[dataKey]
-        colsWithVal = []
-        for i in range(d.shape[1]):
-            tMin = np.min(d[:,i])
-            tMax = np.max(d[:,i])
-            if (tMin == val) and (tMax == val):
-                colsWithVal.append(i)
-        return colsWithVal
+        return np.flatnonzero(self._withval_mask(dataKey, val, 0)).tolist()
 
 
     def get_rows_withval(self, dataKey="raw", val = 0):
         """ Find rows which contain the given val in all its cols
             """
-        d, dCH, dRH = self.get_data(dataKey)
-        rowsWithGivenValOnly = []
-        for i in range(d.shape[0]):
-            tMin = np.min(d[i,:])
-            tMax = np.max(d[i,:])
-            if (tMin == val) and (tMax == val):
-                rowsWithGivenValOnly.append(i)
-        return rowsWithGivenValOnly
+        return np.flatnonzero(self._withval_mask(dataKey, val, 1)).tolist()
+
+
+    def _div_skip0(self, d, denom, dataKey, bHandleRowsOrColsWith0, axis):
+        """ Divide d by the per col (axis=0) or per row (axis=1) denom in a
+            single pass. If bHandleRowsOrColsWith0, then cols or rows which
+            contain only 0 are left as 0 (without dividing them).
+            """
+        if axis == 1:
+            denom = denom.reshape(d.shape[0],1)
+        out = np.zeros(d.shape)
+        if bHandleRowsOrColsWith0:
+            mask = self._withval_mask(dataKey, 0, axis)
+            if axis == 0:
+                mask = mask.reshape(1,d.shape[1])
+            else:
+                mask = mask.reshape(d.shape[0],1)
+            np.divide(d, denom, out=out, where=~mask)
+        else:
+            np.divide(d, denom, out=out)
+        return out
 
 
     def _outdatakey(self, outDataKey, autoKey, inDataKey):
@@ -232,6 +855,9 @@ class AnalPlot:
             theOutDataKey = "%s%s%s"%(inDataKey, DATAOPSCHAINER, autoKey)
         else:
             theOutDataKey = outDataKey
+        self._add_derived(inDataKey, theOutDataKey)
+        # Only get_data knows if the dataKey corresponds to the args used
+        self.sRecipeKeys.discard(theOutDataKey)
         return theOutDataKey
 
 
@@ -259,21 +885,11 @@ class AnalPlot:
                 rows or columns depends on if axis is 1 or 0.
                 Without this such rows or cols will become nan.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
-        if bHandleRowsOrColsWith0:
-            if axis == 0:
-                colsWith0 = self.get_cols_withval(dataKey, 0)
-            else:
-                rowsWith0 = self.get_rows_withval(dataKey, 0)
         theOutDataKey = self._outdatakey(outDataKey, "rel2mean", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        if bHandleRowsOrColsWith0:
-            if axis == 0:
-                self.data[newDKey] = d/np.mean(d, axis=axis)
-                self.data[newDKey][:,colsWith0] = 0
-            else:
-                self.data[newDKey] = d/np.mean(d, axis=axis).reshape(d.shape[0],1)
-                self.data[newDKey][rowsWith0,:] = 0
+        self.data[newDKey] = store_array(self._div_skip0(d, np.mean(d, axis=axis), dataKey, bHandleRowsOrColsWith0, axis))
         self.data[newRHKey] = dRH
         self.data[newCHKey] = dCH
 
@@ -302,21 +918,11 @@ class AnalPlot:
                 rows or columns depends on if axis is 1 or 0.
                 Without this such rows or cols will contain nan in them.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
-        if bHandleRowsOrColsWith0:
-            if axis == 0:
-                colsWith0 = self.get_cols_withval(dataKey, 0)
-            else:
-                rowsWith0 = self.get_rows_withval(dataKey, 0)
         theOutDataKey = self._outdatakey(outDataKey, "rel2sum", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        if bHandleRowsOrColsWith0:
-            if axis == 0:
-                self.data[newDKey] = d/np.sum(d, axis=0)
-                self.data[newDKey][:,colsWith0] = 0
-            else:
-                self.data[newDKey] = d/np.sum(d, axis=1).reshape(d.shape[0],1)
-                self.data[newDKey][rowsWith0,:] = 0
+        self.data[newDKey] = store_array(self._div_skip0(d, np.sum(d, axis=axis), dataKey, bHandleRowsOrColsWith0, axis))
         self.data[newRHKey] = dRH
         self.data[newCHKey] = dCH
 
@@ -352,6 +958,7 @@ class AnalPlot:
                 1: operate on data across cols, i.e on each row of data
             NOTE: this can work on a 2D data set, inturn on its rows or cols.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         if inMin == None:
             inMin = np.min(d, axis)
@@ -378,7 +985,7 @@ class AnalPlot:
         outRange = outMax-outMin
         theOutDataKey = self._outdatakey(outDataKey, "scale", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = (((d-inMin)/inRange)*outRange)+outMin
+        self.data[newDKey] = store_array((((d-inMin)/inRange)*outRange)+outMin)
         self.data[newRHKey] = dRH
         self.data[newCHKey] = dCH
 
@@ -403,10 +1010,11 @@ class AnalPlot:
             outDataKey: key used to identify/store the results of operation.
             NOTE: It can work with 2D datasets, either across its rows or cols
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         theOutDataKey = self._outdatakey(outDataKey, "diff", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = np.diff(d, axis=axis)
+        self.data[newDKey] = store_array(np.diff(d, axis=axis))
         if axis == 0:
             self.data[newRHKey] = dRH[1:]
             self.data[newCHKey] = dCH
@@ -435,10 +1043,11 @@ class AnalPlot:
             outDataKey: key used to identify/store the results of operation.
             NOTE: It can work with 2D datasets, either across its rows or cols
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         theOutDataKey = self._outdatakey(outDataKey, "cumsum", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = np.cumsum(d, axis=axis)
+        self.data[newDKey] = store_array(np.cumsum(d, axis=axis))
         self.data[newRHKey] = dRH
         self.data[newCHKey] = dCH
 
@@ -458,10 +1067,11 @@ class AnalPlot:
             outDataKey: key used to identify/store the results of operation.
             NOTE: It can work with 2D datasets.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         theOutDataKey = self._outdatakey(outDataKey, "log10", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = np.log10(d)
+        self.data[newDKey] = store_array(np.log10(d))
         self.data[newRHKey] = dRH
         self.data[newCHKey] = dCH
 
@@ -483,7 +1093,7 @@ class AnalPlot:
                 dataConv[i,:] = np.convolve(d[i,:], tWeight, 'valid')
         theOutDataKey = self._outdatakey(outDataKey, "movavg", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = dataConv
+        self.data[newDKey] = store_array(dataConv)
         if axis == 0:
             self.data[newRHKey] = list(range(dataConv.shape[0]))
             self.data[newCHKey] = dCH
@@ -492,8 +1102,9 @@ class AnalPlot:
             self.data[newCHKey] = list(range(dataConv.shape[1]))
 
 
-    def _call_calc_movavg(self, inDataKey, outDataKey, lArgNames, lArgVals):
-        """ Helper routine to call calc_movavg related to dataKey DataOpsChaining
+    def _movavg_args(self, lArgNames, lArgVals):
+        """ Extract the windowSize, times and axis args of movavg, given in
+            dataKey DataOpsChaining notation.
 
             OLD NOTE: default for times is 1, so that this logic can be also used
             to get the semantics of normal movavg call when no arguments are given.
@@ -510,35 +1121,71 @@ class AnalPlot:
                 windowSize = int(lArgVals[lArgNames.index(arg)])
             else:
                 print("WARN:AnalPlot:callCalcMovAvg:Unknown arg[%s]"%(arg))
+        return windowSize, times, axis
+
+
+    def _call_calc_movavg(self, inDataKey, outDataKey, lArgNames, lArgVals):
+        """ Helper routine to call calc_movavg related to dataKey DataOpsChaining
+            """
+        windowSize, times, axis = self._movavg_args(lArgNames, lArgVals)
         self.dCalcFuncsWithArgs['movavg'][0](self, dataKey=inDataKey, outDataKey=outDataKey, windowSize=windowSize, times=times, axis=axis)
 
 
-    def calc_movavg(self, dataKey="raw", windowSize=7, times=1, bRoundToDeci8=True, outDataKey="__AUTO__", axis=0):
-        """ Calculate sliding window averages for values in the dataset
-            along each row (axis=1) or column (axis=0).
-            windowSize: the sliding window size
-            times: the number of times movavg should be applied to specified data
-            bRoundToDeci8: this forces the values to be rounded down to 8 decimal
-                places if required.
+    def _movavg_cumsum(self, d, windowSizes=[7], times=1, axis=0):
+        """ Calculate movavg of all the rows (axis=1) or cols (axis=0) of the given
+            data at once, using the difference of cumulative sums, so that the cost
+            doesnt depend on the windowSize. The movavg for each of the given
+            windowSizes is returned, all of which share the same cumsum(s).
+
+            If the data is integral (and the sums cant overflow int64), then all the
+            times passes are done as a single composed kernel, ie times cumsums
+            followed by times differences, computed exactly in int64.
+            Else each pass is done in turn. If the cumsums can grow large enough for
+            their rounding errors to show up in the 8 decimal places, which movavg
+            rounds to, then extended precision (longdouble) is used for the cumsums.
+            """
+        dA = np.moveaxis(np.asarray(d), axis, 0)
+        numPos = dA.shape[0]
+        tZeros = np.zeros((1,)+dA.shape[1:])
+        bIntegral = False
+        fMaxAbs = np.inf
+        if (dA.size > 0) and np.all(np.isfinite(dA)):
+            fMaxAbs = float(np.max(np.abs(dA)))
+            if np.issubdtype(dA.dtype, np.integer) or np.all(dA == np.trunc(dA)):
+                bIntegral = (fMaxAbs*float(numPos+1)**times) < 2.0**62
+        lOut = []
+        if bIntegral:
+            dSum = dA.astype(np.int64)
+            for time in range(times):
+                dSum = np.cumsum(np.concatenate((tZeros.astype(np.int64), dSum)), axis=0)
+            for windowSize in windowSizes:
+                dCur = dSum
+                for time in range(times):
+                    dCur = dCur[windowSize:] - dCur[:-windowSize]
+                lOut.append(np.moveaxis(dCur/float(windowSize**times), 0, axis))
+            return lOut
+        if (fMaxAbs*(numPos+1)*np.finfo(float).eps) < 1e-12:
+            accType = float
+        else:
+            accType = np.longdouble
+        tZeros = tZeros.astype(accType)
+        dSum = np.cumsum(np.concatenate((tZeros, dA.astype(accType))), axis=0)
+        for windowSize in windowSizes:
+            dCur = (dSum[windowSize:] - dSum[:-windowSize])/windowSize
+            for time in range(1, times):
+                dCur = np.cumsum(np.concatenate((tZeros, dCur)), axis=0)
+                dCur = (dCur[windowSize:] - dCur[:-windowSize])/windowSize
+            lOut.append(np.moveaxis(dCur.astype(float), 0, axis))
+        return lOut
+
+
+    def _set_movavg(self, theOutDataKey, dCur, dCH, dRH, windowSize, times, axis, bRoundToDeci8):
+        """ Store the given movavg result along with its trimmed col or row header
             """
-        d, dCH, dRH = self.get_data(dataKey)
-        tWeight = np.ones(windowSize)/windowSize
-        dCur = d
-        for time in range(times):
-            if axis == 0:
-                dataConv = np.zeros((dCur.shape[0]-(windowSize-1),dCur.shape[1]))
-                for i in range(0,dCur.shape[1]):
-                    dataConv[:,i] = np.convolve(dCur[:,i], tWeight, 'valid')
-            else:
-                dataConv = np.zeros((dCur.shape[0],dCur.shape[1]-(windowSize-1)))
-                for i in range(0,dCur.shape[0]):
-                    dataConv[i,:] = np.convolve(dCur[i,:], tWeight, 'valid')
-            dCur = dataConv
         if bRoundToDeci8:
             dCur = np.round(dCur, 8)
-        theOutDataKey = self._outdatakey(outDataKey, "movavg", dataKey)
         newDKey, newCHKey, newRHKey = self._get_datakeys(theOutDataKey)
-        self.data[newDKey] = dCur
+        self.data[newDKey] = store_array(dCur)
         indexDelta = int(((windowSize-1)*times)/2)
         if axis == 0:
             #self.data[newRHKey] = list(range(dataConv.shape[0]))
@@ -550,6 +1197,99 @@ class AnalPlot:
             self.data[newCHKey] = dCH[indexDelta:-indexDelta]
 
 
+    def calc_movavg(self, dataKey="raw", windowSize=7, times=1, bRoundToDeci8=True, outDataKey="__AUTO__", axis=0):
+        """ Calculate sliding window averages for values in the dataset
+            along each row (axis=1) or column (axis=0).
+            windowSize: the sliding window size
+            times: the number of times movavg should be applied to specified data
+            bRoundToDeci8: this forces the values to be rounded down to 8 decimal
+                places if required.
+
+            All the cols (or rows) are processed at once using cumulative sums,
+            see _movavg_cumsum.
+            """
+        dataKey = self._resolve_datakey(dataKey)
+        d, dCH, dRH = self.get_data(dataKey)
+        dCur = self._movavg_cumsum(d, [windowSize], times, axis)[0]
+        theOutDataKey = self._outdatakey(outDataKey, "movavg", dataKey)
+        self._set_movavg(theOutDataKey, dCur, dCH, dRH, windowSize, times, axis, bRoundToDeci8)
+
+
+    def _movavg_datakey(self, dataKey, windowSize=7, times=1, axis=0):
+        """ The dataKey which get_data would use for the given movavg of dataKey
+            """
+        return self.canonical_datakey("%s%smovavg(W=%d,T=%d,A=%d)"%(dataKey, DATAOPSCHAINER, windowSize, times, axis))
+
+
+    def calc_movavg_multi(self, dataKey="raw", windowSizes=[7], times=1, bRoundToDeci8=True, outDataKeys=None, axis=0):
+        """ Calculate movavg for each of the given windowSizes, for the given dataset.
+            All of them are calculated from the same shared cumsum(s) of the data.
+            outDataKeys: list of dataKeys to store the results into, one per
+                windowSize. If None, the dataKey used by get_data for the
+                corresponding movavg(W=windowSize,...) is used.
+            """
+        dataKey = self._resolve_datakey(dataKey)
+        d, dCH, dRH = self.get_data(dataKey)
+        bRecipe = (outDataKeys == None) and bRoundToDeci8
+        if outDataKeys == None:
+            outDataKeys = [ self._movavg_datakey(dataKey, windowSize, times, axis) for windowSize in windowSizes ]
+        lOut = self._movavg_cumsum(d, windowSizes, times, axis)
+        for i in range(len(windowSizes)):
+            self._add_derived(dataKey, outDataKeys[i])
+            self._set_movavg(outDataKeys[i], lOut[i], dCH, dRH, windowSizes[i], times, axis, bRoundToDeci8)
+            if bRecipe:
+                self.sRecipeKeys.add(outDataKeys[i])
+            else:
+                self.sRecipeKeys.discard(outDataKeys[i])
+
+
+    def prefetch_movavgs(self, lDataKeys, selCols=None):
+        """ Calculate the movavgs among the given list of dataKeys (in dataKey
+            DataOpsChaining notation), which are not yet available, by batching
+            the ones which differ only in windowSize, for the same base dataKey,
+            into a single calc_movavg_multi call.
+
+            If a disk cache dir is set, the movavgs available in it are loaded
+            from there and the calculated ones are saved into it.
+
+            selCols: If specified (and bPUSHDOWN_SELCOLS), the movavgs whose
+                dataOps chain can be pushed down (see _get_data_pushdown) are
+                calculated only for the selected cols, in the col projection,
+                which get_data_selective will use later.
+            """
+        dBatches = {}
+        dProjKeys = {}
+        for dataKey in lDataKeys:
+            dataKey = self.canonical_datakey(dataKey)
+            if (dataKey in self.data) or (DATAOPSCHAINER not in dataKey):
+                continue
+            if (self.diskCacheDir != None) and self._diskcache_load(dataKey):
+                continue
+            if (type(selCols) != type(None)) and bPUSHDOWN_SELCOLS:
+                sBase = self._pushdown_base(dataKey)
+                if sBase != None:
+                    lProjKeys = dProjKeys.setdefault(sBase, [])
+                    lProjKeys.append("sel"+dataKey[len(sBase):])
+                    continue
+            [sBDKey, sCmd] = dataKey.rsplit(DATAOPSCHAINER,1)
+            sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
+            if sFName != "movavg":
+                continue
+            windowSize, times, axis = self._movavg_args(lArgNames, lArgVals)
+            lBatch = dBatches.setdefault((sBDKey, times, axis), [])
+            if dataKey not in [ x[1] for x in lBatch ]:
+                lBatch.append((windowSize, dataKey))
+        for (sBDKey, times, axis), lBatch in dBatches.items():
+            self.calc_movavg_multi(sBDKey, [ x[0] for x in lBatch ], times, outDataKeys=[ x[1] for x in lBatch ], axis=axis)
+            self.sRecipeKeys.update([ x[1] for x in lBatch ])
+            if self.diskCacheDir != None:
+                for windowSize, dataKey in lBatch:
+                    self._diskcache_save(dataKey)
+        for sBase, lProjKeys in dProjKeys.items():
+            self._projection(sBase, selCols).prefetch_movavgs(lProjKeys)
+            self._evict_projections()
+
+
     def selcols_percentiles(self, dataKey="raw", selRow=-1, selPers=[0,100], bSelInclusive=True, topN=None, botN=None):
         """ Select a set of cols belonging to the specified dataKey, which are within
             the specified percentile range wrt their values in the specified row.
@@ -571,6 +1311,7 @@ class AnalPlot:
                 based on percentile calculation for given row in the dataset,
                 use this.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         if (topN != None) and (botN != None):
             print("WARN:AnalPlot:selcols_percentile: botN takes priority if both topN & botN specified")
@@ -600,6 +1341,7 @@ class AnalPlot:
             Returns a list of True or False, based on whether the corresponding
             col is part of the given colIds or not.
             """
+        dataKey = self._resolve_datakey(dataKey)
         d, dCH, dRH = self.get_data(dataKey)
         if colIds == None:
             return dCH == dCH
@@ -630,7 +1372,19 @@ class AnalPlot:
             func name, list of argument names, list of argument values.
 
             "funcname(arg1=val1,arg2=val2,...)"
+
+            The parsed result is memoised, as the same dataOps get parsed again
+            and again, when resolving dataKeys.
             """
+        tKey = (sFunc, id(dFuncsWithArgs))
+        tParsed = _dPARSEDFUNCSTRS.get(tKey)
+        if tParsed == None:
+            tParsed = AnalPlot._parse_funcstr_uncached(sFunc, dFuncsWithArgs)
+            _dPARSEDFUNCSTRS[tKey] = tParsed
+        return tParsed[0], list(tParsed[1]), list(tParsed[2])
+
+
+    def _parse_funcstr_uncached(sFunc, dFuncsWithArgs):
         lTemp = sFunc.split('(',1)
         sFName = lTemp[0]
         lArgNames = []
@@ -647,57 +1401,403 @@ class AnalPlot:
         return None, lArgNames, lArgVals
 
 
-    def get_data(self, dataKey="raw"):
+    # The args of each dataOp, as [canonical name, its aliases, default value]
+    dDataOpArgs = {
+        "scale": [ ["A", ["axis", "A"], 0] ],
+        "diff": [ ["A", ["axis", "A"], 0] ],
+        "cumsum": [ ["A", ["axis", "A"], 0] ],
+        "log10": [ ],
+        "movavg": [ ["W", ["windowSize", "W"], 7], ["T", ["times", "T"], 1], ["A", ["axis", "A"], 0] ],
+        "rel2mean": [ ["A", ["axis", "A"], 0] ],
+        "rel2sum": [ ["A", ["axis", "A"], 0] ],
+    }
+
+    def _canonical_funcstr(self, sCmd):
+        """ Return the canonical form of the given dataOp string. The args are
+            given using their short names, in the order listed in dDataOpArgs, and
+            the args with default values are left out, so that
+                movavg, movavg(W=7), movavg(windowSize=7,T=1), movavg(A=0)
+            all become movavg. This is also the dataKey used by the calc_?????
+            functions for their auto generated outDataKey.
+            If the dataOp or any of its args is unknown, sCmd is returned as is.
+            """
+        sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
+        if (sFName == None) or (sFName not in self.dDataOpArgs):
+            return sCmd
+        lSpecs = self.dDataOpArgs[sFName]
+        dVals = {}
+        for sArg, sVal in zip(lArgNames, lArgVals):
+            for sName, lAliases, defVal in lSpecs:
+                if sArg in lAliases:
+                    break
+            else:
+                return sCmd
+            try:
+                dVals[sName] = int(sVal)
+            except ValueError:
+                return sCmd
+        lArgs = []
+        for sName, lAliases, defVal in lSpecs:
+            if dVals.get(sName, defVal) != defVal:
+                lArgs.append("%s=%d"%(sName, dVals[sName]))
+        if len(lArgs) == 0:
+            return sFName
+        return "%s(%s)"%(sFName, ",".join(lArgs))
+
+
+    def canonical_datakey(self, dataKey):
+        """ Return the canonical form of the given dataKey (in dataKey DataOpsChaining
+            notation), ie with each of its dataOps in canonical form (see
+            _canonical_funcstr). Equivalent spellings of a dataKey thus map to the
+            same cached data. The results are memoised.
+            """
+        sCanon = self.dCanonKeys.get(dataKey)
+        if sCanon != None:
+            return sCanon
+        lParts = dataKey.split(DATAOPSCHAINER)
+        sCanon = DATAOPSCHAINER.join([ lParts[0] ] + [ self._canonical_funcstr(x) for x in lParts[1:] ])
+        self.dCanonKeys[dataKey] = sCanon
+        return sCanon
+
+
+    def _resolve_datakey(self, dataKey):
+        """ Return the given dataKey, if data is stored under it as is, else its
+            canonical form (see canonical_datakey).
+            """
+        if dataKey in self.data:
+            return dataKey
+        return self.canonical_datakey(dataKey)
+
+
+    lFusableDataOps = [ "scale", "log10", "rel2sum", "rel2mean" ]
+
+    def _dataop_axis(self, sFName, lArgNames, lArgVals):
+        """ Extract the axis arg of the fusable dataOps
+            """
+        axis = 0
+        for arg in lArgNames:
+            if ((arg == "axis") or (arg == "A")) and (sFName != "log10"):
+                axis = int(lArgVals[lArgNames.index(arg)])
+            else:
+                print("WARN:AnalPlot:DataOp:%s:Unknown arg[%s]"%(sFName, arg))
+        return axis
+
+
+    def _plan_datakey(self, dataKey):
+        """ Split the given dataKey into the longest prefix (base) dataKey, which
+            is already available, and the list of dataOps to apply on it. Each dataOp
+            is a tuple of func name, arg names, arg vals and the dataKey of its result.
+            Returns None, None if the dataKey cant be planned.
+            """
+        lOps = []
+        sKey = dataKey
+        while (sKey not in self.data) and (DATAOPSCHAINER in sKey):
+            [sBDKey, sCmd] = sKey.rsplit(DATAOPSCHAINER,1)
+            sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
+            if sFName == None:
+                return None, None
+            lOps.insert(0, (sFName, lArgNames, lArgVals, sKey))
+            sKey = sBDKey
+        if sKey not in self.data:
+            return None, None
+        return sKey, lOps
+
+
+    def calc_fused(self, dataKey, outDataKey, lOps):
+        """ Apply a sequence of fusable dataOps (with their default args) on the
+            given dataset in a single pass, without creating the intermediate datasets.
+            lOps: list of (funcName, axis), where funcName is one of rel2sum, rel2mean
+                or scale, all having the same axis, optionally followed by a log10.
+
+            rel2sum and rel2mean multiply the values of each col (axis=0) or row
+            (axis=1) by a factor, which depends only on the sum of that col or row.
+            The sums of the intermediate data are derived from the stats of the
+            input data, so a run of them is composed into a single multiply. scale
+            maps the values as (val-min)/(max-min), which is applied as is (after
+            any pending multiply), so that the min values become exactly 0, same
+            as when calculated step by step (which matters for a following log10).
+
+            Cols (or rows) which contain only 0 are left as 0 by rel2sum and rel2mean,
+            same as their bHandleRowsOrColsWith0 logic.
+            """
+        d, dCH, dRH = self.get_data(dataKey)
+        lAffine = [ x for x in lOps if x[0] != "log10" ]
+        out = None
+        if len(lAffine) > 0:
+            axis = lAffine[0][1]
+            n = d.shape[axis]
+            if axis == 1:
+                bcShape = (d.shape[0],1)
+            else:
+                bcShape = (1,d.shape[1])
+            tSum = np.sum(d, axis=axis, dtype=float)
+            tMin = np.min(d, axis=axis).astype(float)
+            tMax = np.max(d, axis=axis).astype(float)
+            bZero = self._withval_mask(dataKey, 0, axis)
+            a = np.ones(tSum.shape)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for sFName, iAxis in lAffine:
+                    cSum = a*tSum
+                    if sFName == "rel2sum":
+                        a = np.where(bZero, 0, 1/cSum)*a
+                        continue
+                    if sFName == "rel2mean":
+                        a = np.where(bZero, 0, n/cSum)*a
+                        continue
+                    cMin = np.where(a >= 0, a*tMin, a*tMax)
+                    cMax = np.where(a >= 0, a*tMax, a*tMin)
+                    cRange = cMax-cMin
+                    if out is None:
+                        out = np.multiply(d, a.reshape(bcShape))
+                    else:
+                        np.multiply(out, a.reshape(bcShape), out=out)
+                    np.subtract(out, cMin.reshape(bcShape), out=out)
+                    np.divide(out, cRange.reshape(bcShape), out=out)
+                    tSum = (cSum - n*cMin)/cRange
+                    tMin = (cMin - cMin)/cRange
+                    tMax = cRange/cRange
+                    a = np.ones(tSum.shape)
+                    bZero = np.zeros(tSum.shape, dtype=bool)
+            if out is None:
+                out = np.multiply(d, a.reshape(bcShape))
+            elif lAffine[-1][0] != "scale":
+                np.multiply(out, a.reshape(bcShape), out=out)
+        else:
+            out = np.array(d, dtype=float)
+        if lOps[-1][0] == "log10":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.log10(out, out=out)
+        self._add_derived(dataKey, outDataKey)
+        self.sRecipeKeys.discard(outDataKey)
+        newDKey, newCHKey, newRHKey = self._get_datakeys(outDataKey)
+        self.data[newDKey] = store_array(out)
+        self.data[newRHKey] = dRH
+        self.data[newCHKey] = dCH
+
+
+    def _get_data_planned(self, dataKey, lCacheKeys=None):
+        """ Plan the dataOps chain of dataKey up front and calculate it, by fusing
+            each run of consecutive fusable dataOps (scale, rel2sum, rel2mean with
+            the same axis, optionally ending with log10) into a single calc_fused.
+            The intermediate results within such a run are not stored, unless
+            their dataKeys are in lCacheKeys. Other dataOps are calculated as usual.
+            Returns False, if the chain couldnt be planned or has nothing to fuse.
+            """
+        sCurKey, lOps = self._plan_datakey(dataKey)
+        if lOps == None:
+            return False
+        if len([ x for x in lOps if x[0] in self.lFusableDataOps ]) < 2:
+            return False
+        i = 0
+        while i < len(lOps):
+            sFName, lArgNames, lArgVals, sOpKey = lOps[i]
+            if sFName not in self.lFusableDataOps:
+                self.get_data(sOpKey)
+                sCurKey = sOpKey
+                i += 1
+                continue
+            lGroup = []
+            groupAxis = None
+            while i < len(lOps):
+                sFName, lArgNames, lArgVals, sOpKey = lOps[i]
+                if sFName not in self.lFusableDataOps:
+                    break
+                axis = self._dataop_axis(sFName, lArgNames, lArgVals)
+                if sFName != "log10":
+                    if (groupAxis != None) and (axis != groupAxis):
+                        break
+                    groupAxis = axis
+                lGroup.append((sFName, axis))
+                sGroupKey = sOpKey
+                i += 1
+                if (sFName == "log10") or ((lCacheKeys != None) and (sOpKey in lCacheKeys)):
+                    break
+            self.calc_fused(sCurKey, sGroupKey, lGroup)
+            self.sRecipeKeys.add(sGroupKey)
+            sCurKey = sGroupKey
+        return True
+
+
+    def _raw_hash(self, dataKey):
+        """ Return the hash of the given raw dataset (data and its headers). It is
+            cached along with the data it was calculated for, like _withval_mask.
+            """
+        d, dCH, dRH = self._get_data(dataKey)
+        if dataKey in self.dRawHashes:
+            dCached, sHash = self.dRawHashes[dataKey]
+            if dCached is d:
+                return sHash
+        h = hashlib.sha256()
+        h.update("{}:{}:{}:{}".format(d.dtype, d.shape, dCH.tolist(), dRH.tolist()).encode())
+        h.update(np.ascontiguousarray(d).tobytes())
+        sHash = h.hexdigest()
+        self.dRawHashes[dataKey] = (d, sHash)
+        return sHash
+
+
+    def _diskcache_filenames(self, dataKey):
+        """ Return the data and headers file names in the disk cache for the given
+            dataKey. Its the hash of the raw dataset it is derived from, its dataOps
+            chain and the dtype policy. Returns None, None if it isnt cacheable.
+            """
+        sRoot = self._datakey_root(dataKey)
+        if (sRoot == None) or (sRoot == dataKey) or (sRoot in self.sTempRaws):
+            return None, None
+        sKey = "{}\n{}\n{}".format(self._raw_hash(sRoot), dataKey[len(sRoot):], get_dtype_policy())
+        sKey = hashlib.sha256(sKey.encode()).hexdigest()
+        sBase = os.path.join(self.diskCacheDir, sKey)
+        return sBase+".npy", sBase+".hdr.npz"
+
+
+    def _diskcache_load(self, dataKey):
+        """ Load the given dataKey from the disk cache, if available there.
+            The data is memory mapped (read only).
+            """
+        sDFile, sHFile = self._diskcache_filenames(dataKey)
+        if (sDFile == None) or (not os.path.exists(sDFile)) or (not os.path.exists(sHFile)):
+            return False
+        try:
+            d = np.load(sDFile, mmap_mode="r", allow_pickle=False)
+            with np.load(sHFile, allow_pickle=False) as hdrs:
+                dCH = hdrs["ColHdr"]
+                dRH = hdrs["RowHdr"]
+        except (OSError, ValueError, KeyError) as e:
+            print("WARN:AnalPlot:DiskCache:Load:%s:%s"%(dataKey, e))
+            return False
+        dprint("DBUG:AnalPlot:DiskCache:Loaded:%s:%s"%(dataKey, sDFile))
+        try:
+            # Mark as recently used, for _diskcache_prune
+            os.utime(sHFile)
+        except OSError:
+            pass
+        self._add_derived(dataKey.rsplit(DATAOPSCHAINER,1)[0], dataKey)
+        newDKey, newCHKey, newRHKey = self._get_datakeys(dataKey)
+        self.data[newDKey] = d
+        self.data[newRHKey] = dRH
+        self.data[newCHKey] = dCH
+        self.sRecipeKeys.add(dataKey)
+        return True
+
+
+    def _diskcache_save(self, dataKey):
+        """ Save the given dataKey into the disk cache, if it can be reloaded
+            later (ie it is derived from a raw dataset and isnt of object dtype)
+            """
+        sDFile, sHFile = self._diskcache_filenames(dataKey)
+        if sDFile == None:
+            return
+        d, dCH, dRH = self._get_data(dataKey)
+        for a in [ d, dCH, dRH ]:
+            if np.asarray(a).dtype.hasobject:
+                return
+        tmpDFile = "{}.tmp".format(sDFile)
+        tmpHFile = "{}.tmp".format(sHFile)
+        f = open(tmpDFile, "wb")
+        np.save(f, d, allow_pickle=False)
+        f.close()
+        f = open(tmpHFile, "wb")
+        np.savez(f, ColHdr=dCH, RowHdr=dRH)
+        f.close()
+        os.replace(tmpHFile, sHFile)
+        os.replace(tmpDFile, sDFile)
+
+
+    def get_data(self, dataKey="raw", lCacheKeys=None):
         """ Return the specified data and its col and row headers
             Create them by calling required calc functions, if required and possible.
 
             NOTE: If data is already available, then return it. Only if it is not
             there, try to create it by assuming that the given dataKey follows
             dataKey dataOpsChaining notatation and inturn calling specified dataOps.
+
+            If bFUSE_DATAOPS, then consecutive elementwise or per col/row affine
+            dataOps (scale, log10, rel2sum, rel2mean) in the chain are fused into a
+            single pass and their intermediate results are not stored, except for
+            those whose dataKeys are in lCacheKeys. If lCacheKeys is True, then all
+            the intermediate results are stored (ie no fusion).
+
+            If a disk cache dir is set, then the data is loaded from it, if already
+            available there, else the calculated data is saved into it.
+
+            The dataKey is converted to its canonical form (see canonical_datakey),
+            so that equivalent dataKeys share the same data.
             """
+        dataKey = self._resolve_datakey(dataKey)
         if dataKey in self.data:
             return self._get_data(dataKey)
+        if (self.diskCacheDir != None) and self._diskcache_load(dataKey):
+            return self._get_data(dataKey)
+        if (lCacheKeys != None) and (lCacheKeys != True):
+            lCacheKeys = [ self.canonical_datakey(x) for x in lCacheKeys ]
+        self._calc_data(dataKey, lCacheKeys)
+        self.sRecipeKeys.add(dataKey)
+        if self.diskCacheDir != None:
+            self._diskcache_save(dataKey)
+        return self._get_data(dataKey)
+
+
+    def _calc_data(self, dataKey, lCacheKeys=None):
+        """ Create the specified data, which is not yet available, by calling the
+            required calc functions as per its dataKey dataOpsChaining notation.
+            """
+        if bFUSE_DATAOPS and (lCacheKeys != True):
+            if self._get_data_planned(dataKey, lCacheKeys):
+                return
         # This means data not in dict, lets see if we can create it
         [sBDKey, sCmd] = dataKey.rsplit(DATAOPSCHAINER,1)
         # Create using a simple calc func
         if sCmd in self.dCalcSimpleFuncs:
             self.dCalcSimpleFuncs[sCmd](self, sBDKey)
-            return self._get_data(dataKey)
+            return
         # Handle funcs with arguments using the new syntax
         sFName, lArgNames, lArgVals = AnalPlot._parse_funcstr(sCmd, self.dCalcFuncsWithArgs)
         if sFName != None:
             self.dCalcFuncsWithArgs[sFName][1](self, sBDKey, dataKey, lArgNames, lArgVals)
-            return self._get_data(dataKey)
+            return
         # Dont understand the data ops function being refered
         raise NotImplementedError("AnalPlot:get_data:{}:Func[{}] not found...\n\tAvailable DataSets:{}".format(dataKey, sCmd, self.data.keys()))
 
 
+    def _prune_valmasks(self):
+        """ Drop the cached masks of deleted datasets, so they dont keep them alive
+            """
+        for tKey in list(self.dValMasks.keys()):
+            if tKey[0] not in self.data:
+                self.dValMasks.pop(tKey)
+
+
     def del_data(self, dataKey, bDelDataDerivedFromThis=True):
         """ Remove the specified dataKey and its associated data and headers
 
             bDelDataDerivedFromThis = True: will also delete all data created
-                by using the specified dataKey as the base in the dataOpsChaining,
-                provided the dataKey names of all these data start with dataKey.
-                This is the case if calc_????? functions are allowed to set the
-                dataKey for their calculated data.
+                by using the specified dataKey as the base (directly or through
+                other derived datasets) in the dataOpsChaining or calc_????? calls,
+                irrespective of the dataKeys they are stored under. Unrelated
+                datasets, even if their dataKey starts with dataKey, are not touched.
 
-                NOTE: If some unrelated dataset is stored in the AnalPlot instance
-                with a dataKey name whose starting part matchs the dataKey passed
-                to del_data, then even it and its derived datasets will/can get
-                deleted.
+                The datasets derived from each dataset are tracked as they are
+                created (see _add_derived), so only those datasets are visited.
 
                 NOTE: Not just the data, but also their associated col and row
                 header data is also deleted.
+
+            Like get_data, equivalent spellings of a dataKey (see canonical_datakey)
+            refer to the same data.
             """
+        dataKey = self._resolve_datakey(dataKey)
         sDKey, sCHKey, sRHKey = self._get_datakeys(dataKey)
         self.data.pop(sDKey)
         self.data.pop(sCHKey)
         self.data.pop(sRHKey)
+        self.sRecipeKeys.discard(sDKey)
+        self.sTempRaws.discard(sDKey)
         if bDelDataDerivedFromThis:
-            tKeys = list(self.data.keys())
-            for key in tKeys:
-                if key.startswith(dataKey):
-                    self.data.pop(key)
+            self._del_derived(sDKey)
+        self._forget_derived(sDKey)
+        self._prune_valmasks()
+        for tKey in list(self.dProjections.keys()):
+            if tKey[0] not in self.data:
+                self.dProjections.pop(tKey)
         dprint("DBUG:AnalPlot:del_data:%s:%s"%(dataKey, self.data.keys()))
 
 
@@ -806,7 +1906,7 @@ class AnalPlot:
         tY = np.cos(tRads)
         print("DBUG:AnalPlot:CircleSpread:DataRowIn",tD[selRow,:])
         if adjustMode == "relative":
-            self.set_raw(tD[selRow,:], dataKey=tempBaseKey)
+            self.set_raw(tD[selRow,:], dataKey=tempBaseKey, bTemp=True)
             tAmp, aCH, aRH = self.get_data("%s>scale(A=1)"%(tempBaseKey))
             print("DBUG:AnalPlot:CircleSpread:DataRowScaled:",tAmp)
             tAmp = tAmp[-1,:]
@@ -1298,7 +2398,7 @@ class AnalPlot:
             change this by setting the tempBaseKey argument, if required.
             """
         d, dCH, dRH = self.get_data_selective(dataKey, selCols, selRows)
-        self.set_raw(d, rowHdr=dRH, colHdr=dCH, dataKey=tempBaseKey)
+        self.set_raw(d, rowHdr=dRH, colHdr=dCH, dataKey=tempBaseKey, bTemp=True)
         if (dataOps == None) or (dataOps == ""):
             dOpsKey = tempBaseKey
         else:
@@ -1603,6 +2703,8 @@ def plot_matrix(ap, rowDataKeys, colDataKeys, axes, iRow, iCol, plotSelCols=None
 
         title: The title to put for each plot.
         """
+    # Calculate the movavgs with different windows of the same data in one go
+    ap.prefetch_movavgs([ _plotmatrix_datakey(dkRow, dkCol, axis) for dkRow in rowDataKeys for dkCol in colDataKeys ], plotSelCols)
     inRow, inCol = iRow, iCol
     for dkRow in rowDataKeys:
         iCol = inCol
@@ -10,10 +10,518 @@ import subprocess
 import numpy
 import sys
 import calendar
+import json
+import shutil
+import hashlib
+import threading
+import concurrent.futures
+import zipfile
+import io
+import csv
+import xml.etree.ElementTree as ET
+import email.utils
+import http.client
+import urllib.parse
 from helpers import *
 
 
 
+def hash_file(fileName):
+    """ Return the sha256 hash of the contents of the given file
+        """
+    h = hashlib.sha256()
+    f = open(fileName, "rb")
+    while True:
+        tBuf = f.read(65536)
+        if len(tBuf) == 0:
+            break
+        h.update(tBuf)
+    f.close()
+    return h.hexdigest()
+
+
+
+class HttpDownloader:
+    """ A simple in-process http/https downloader, which keeps a pool of
+        keep-alive connections per server, so that multiple downloads from
+        the same server reuse connections.
+
+        It also supports conditional GET, i.e if the caller passes the
+        etag and or lastModified validators got from a previous download,
+        the server can respond with 304 (Not Modified) and the transfer
+        is skipped.
+        """
+
+    lRedirectCodes = [ 301, 302, 303, 307, 308 ]
+
+    def __init__(self, timeout=60, maxRedirects=8, blockSize=65536):
+        self.timeout = timeout
+        self.maxRedirects = maxRedirects
+        self.blockSize = blockSize
+        self.dIdleConns = {}
+        self.lock = threading.Lock()
+
+
+    def _get_conn(self, scheme, netloc):
+        """ Get a idle connection to the given server from the pool,
+            or else create a new one.
+            """
+        with self.lock:
+            lConns = self.dIdleConns.get((scheme, netloc), [])
+            if len(lConns) > 0:
+                return lConns.pop()
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise ValueError("HttpDownloader:_get_conn:Unsupported scheme {}".format(scheme))
+
+
+    def _put_conn(self, scheme, netloc, conn):
+        """ Return a connection back to the pool, so that it can be reused.
+            """
+        with self.lock:
+            self.dIdleConns.setdefault((scheme, netloc), []).append(conn)
+
+
+    def close(self):
+        """ Close all the idle connections in the pool
+            """
+        with self.lock:
+            for lConns in self.dIdleConns.values():
+                for conn in lConns:
+                    conn.close()
+            self.dIdleConns = {}
+
+
+    def _request(self, conn, path, headers, method="GET"):
+        """ Send a request on the given connection and return the response.
+            If a reused keep-alive connection was closed by the server in the
+            mean time, the request is retried once on a fresh connection.
+            """
+        try:
+            conn.request(method, path, headers=headers)
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            conn.request(method, path, headers=headers)
+            return conn.getresponse()
+
+
+    def _split_url(self, theUrl):
+        """ Return the scheme, netloc and path (including query) of the url
+            """
+        tUrl = urllib.parse.urlsplit(theUrl)
+        path = tUrl.path
+        if path == "":
+            path = "/"
+        if tUrl.query != "":
+            path = "{}?{}".format(path, tUrl.query)
+        return tUrl.scheme, tUrl.netloc, path
+
+
+    def probe(self, theUrl):
+        """ Check if the given url is available, without downloading it.
+            A HEAD request is used and if the server doesnt support it, then
+            a GET of just its 1st byte (Range request) is used.
+
+            Returns True if available, False if the server responds with a
+            error status. Raises ConnectionError, if the server cant be reached.
+            """
+        curUrl = theUrl
+        method = "HEAD"
+        for i in range(self.maxRedirects+2):
+            scheme, netloc, path = self._split_url(curUrl)
+            conn = self._get_conn(scheme, netloc)
+            headers = {}
+            if method == "GET":
+                headers["Range"] = "bytes=0-0"
+            try:
+                resp = self._request(conn, path, headers, method)
+                if resp.status in self.lRedirectCodes:
+                    resp.read()
+                    self._put_conn(scheme, netloc, conn)
+                    curUrl = urllib.parse.urljoin(curUrl, resp.getheader("Location"))
+                    continue
+                if (method == "HEAD") and (resp.status in [ 405, 501 ]):
+                    resp.read()
+                    self._put_conn(scheme, netloc, conn)
+                    method = "GET"
+                    continue
+                if (method == "GET") and (resp.status == 200):
+                    # Server ignored the Range, dont read the full document
+                    conn.close()
+                    return True
+                resp.read()
+                self._put_conn(scheme, netloc, conn)
+                return resp.status in [ 200, 206 ]
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise ConnectionError("HttpDownloader:probe:{}: {}".format(curUrl, e))
+        raise ConnectionError("HttpDownloader:probe:{}: Too many redirects".format(theUrl))
+
+
+    def get(self, theUrl, localFileName, etag=None, lastModified=None):
+        """ Download the given url into the specified local file.
+
+            etag, lastModified: If specified, they are sent as If-None-Match
+                and If-Modified-Since headers, so that the server can skip the
+                transfer, if the document has not changed.
+
+            Returns (bModified, etag, lastModified)
+                bModified: False if server responded with 304, else True.
+                etag, lastModified: the validators to use for the next get.
+
+            The data is first saved into a temp file and then renamed, so that
+            a partial download doesnt overwrite a previously downloaded file.
+            """
+        headers = {}
+        if etag != None:
+            headers["If-None-Match"] = etag
+        if lastModified != None:
+            headers["If-Modified-Since"] = lastModified
+        curUrl = theUrl
+        for i in range(self.maxRedirects+1):
+            scheme, netloc, path = self._split_url(curUrl)
+            conn = self._get_conn(scheme, netloc)
+            try:
+                resp = self._request(conn, path, headers)
+                if resp.status in self.lRedirectCodes:
+                    resp.read()
+                    self._put_conn(scheme, netloc, conn)
+                    curUrl = urllib.parse.urljoin(curUrl, resp.getheader("Location"))
+                    continue
+                if resp.status == 304:
+                    resp.read()
+                    self._put_conn(scheme, netloc, conn)
+                    return False, etag, lastModified
+                if resp.status != 200:
+                    raise ConnectionError("HttpDownloader:{}: Got {} {}".format(curUrl, resp.status, resp.reason))
+                tmpFileName = "{}.dltmp".format(localFileName)
+                with open(tmpFileName, "wb") as f:
+                    while True:
+                        tBuf = resp.read(self.blockSize)
+                        if len(tBuf) == 0:
+                            break
+                        f.write(tBuf)
+                os.replace(tmpFileName, localFileName)
+                self._put_conn(scheme, netloc, conn)
+                return True, resp.getheader("ETag"), resp.getheader("Last-Modified")
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if isinstance(e, ConnectionError):
+                    raise
+                raise ConnectionError("HttpDownloader:{}: {}".format(curUrl, e))
+        raise ConnectionError("HttpDownloader:{}: Too many redirects".format(theUrl))
+
+
+
+gDownloader = HttpDownloader()
+
+
+
+class DownloadCache:
+    """ A content addressed cache of the downloaded (and converted) files.
+
+        The content of each file is stored once as objects/<sha256> in the
+        cache dir, and the files in data/ are hardlinks to (or copies of) these
+        objects. So identical content fetched on different days is stored only
+        once.
+
+        The manifest maps each downloaded file to its url, http validators,
+        content hash and fetch time. It also maps each content hash to the
+        content hash of the data got by converting it, so that the conversion
+        is done only once for a given content.
+        """
+
+    def __init__(self, cacheDir="data/cache"):
+        self.cacheDir = cacheDir
+        self.objDir = os.path.join(cacheDir, "objects")
+        self.manifestFileName = os.path.join(cacheDir, "manifest.json")
+        self.lock = threading.RLock()
+
+
+    def _load_manifest(self):
+        try:
+            f = open(self.manifestFileName)
+            dManifest = json.load(f)
+            f.close()
+            return dManifest
+        except (OSError, ValueError):
+            return { "files": {}, "convs": {} }
+
+
+    def _save_manifest(self, dManifest):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmpFileName = "{}.tmp".format(self.manifestFileName)
+        f = open(tmpFileName, "w")
+        json.dump(dManifest, f, indent=1)
+        f.close()
+        os.replace(tmpFileName, self.manifestFileName)
+
+
+    def get_entry(self, fileName):
+        """ Return the manifest entry of the given file, or a empty dict
+            """
+        with self.lock:
+            return self._load_manifest()["files"].get(fileName, {})
+
+
+    def put_entry(self, fileName, dEntry):
+        """ Save the given manifest entry for the given file
+            """
+        with self.lock:
+            dManifest = self._load_manifest()
+            dManifest["files"][fileName] = dEntry
+            self._save_manifest(dManifest)
+
+
+    def get_url_entry(self, theUrl):
+        """ Return the manifest entry of the latest file fetched from the given
+            url, whose content is still in the cache, or a empty dict.
+            """
+        dLatest = {}
+        with self.lock:
+            dManifest = self._load_manifest()
+        for dEntry in dManifest["files"].values():
+            if (dEntry.get("url") != theUrl) or ("hash" not in dEntry):
+                continue
+            if not os.path.exists(self.obj_filename(dEntry["hash"])):
+                continue
+            if dEntry.get("fetchTime", 0) > dLatest.get("fetchTime", 0):
+                dLatest = dEntry
+        return dLatest
+
+
+    def obj_filename(self, sHash):
+        """ Return the name of the cache object file for the given content hash
+            """
+        return os.path.join(self.objDir, sHash)
+
+
+    def is_fresh(self, fileName, ttl):
+        """ Check if the given file was fetched within the last ttl seconds
+            """
+        fetchTime = self.get_entry(fileName).get("fetchTime")
+        if fetchTime == None:
+            return False
+        return (time.time() - fetchTime) < ttl
+
+
+    def link(self, srcFileName, dstFileName):
+        """ Make dstFileName refer to the same content as srcFileName.
+            A hardlink is used if possible, else the file is copied.
+            """
+        if os.path.exists(dstFileName) and os.path.samefile(srcFileName, dstFileName):
+            return
+        tmpFileName = "{}.lntmp".format(dstFileName)
+        try:
+            os.link(srcFileName, tmpFileName)
+        except OSError:
+            shutil.copyfile(srcFileName, tmpFileName)
+        os.replace(tmpFileName, dstFileName)
+
+
+    def add_file(self, fileName):
+        """ Add the content of the given file to the cache, if not already
+            there, and make the file refer to the cached content.
+            Returns the content hash.
+            """
+        sHash = hash_file(fileName)
+        objFileName = self.obj_filename(sHash)
+        os.makedirs(self.objDir, exist_ok=True)
+        if os.path.exists(objFileName):
+            self.link(objFileName, fileName)
+        else:
+            self.link(fileName, objFileName)
+        return sHash
+
+
+    def get_conv(self, convType, fileName):
+        """ Return the cached object file, which contains the result of the
+            convType conversion of the given file's content, or None.
+            """
+        with self.lock:
+            dManifest = self._load_manifest()
+        sHash = dManifest["files"].get(fileName, {}).get("hash")
+        if sHash == None:
+            return None
+        sConvHash = dManifest["convs"].get("{}:{}".format(convType, sHash))
+        if sConvHash == None:
+            return None
+        objFileName = self.obj_filename(sConvHash)
+        if not os.path.exists(objFileName):
+            return None
+        return objFileName
+
+
+    def add_conv(self, convType, fileName, convFileName):
+        """ Add the given convFileName to the cache, as the result of the
+            convType conversion of the given file's content.
+            """
+        sConvHash = self.add_file(convFileName)
+        with self.lock:
+            dManifest = self._load_manifest()
+            dEntry = dManifest["files"].setdefault(fileName, {})
+            if "hash" not in dEntry:
+                dEntry["hash"] = self.add_file(fileName)
+            dManifest["convs"]["{}:{}".format(convType, dEntry["hash"])] = sConvHash
+            self._save_manifest(dManifest)
+
+
+
+gDownloadCache = DownloadCache()
+
+
+
+class XlsxReader:
+    """ A simple streaming reader for the 1st sheet of a xlsx file, which
+        uses zipfile and incremental xml parsing (iterparse), so that the
+        sheet is never fully loaded into memory. Only the required columns
+        are extracted.
+
+        Cell values are returned as str for string cells and as float for
+        numeric cells (including dates, which are stored as day serials).
+        Empty cells are returned as None.
+        """
+
+    NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    NSREL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+
+
+    def is_xlsx(fileName):
+        """ Check if the given file is a xlsx (i.e zip based) file.
+            NOTE: A class and not a instance function.
+            """
+        return zipfile.is_zipfile(fileName)
+
+
+    def _shared_strings(self, zf):
+        """ Load the shared strings table, if any.
+            """
+        lStrings = []
+        if "xl/sharedStrings.xml" not in zf.namelist():
+            return lStrings
+        f = zf.open("xl/sharedStrings.xml")
+        for event, elem in ET.iterparse(f):
+            if elem.tag == self.NS+"si":
+                lStrings.append("".join(elem.itertext()))
+                elem.clear()
+        f.close()
+        return lStrings
+
+
+    def _first_sheet(self, zf):
+        """ Find the xml file of the 1st sheet in the workbook. It also notes
+            down if the workbook uses the 1904 date system.
+            """
+        wb = ET.fromstring(zf.read("xl/workbook.xml"))
+        wbPr = wb.find(self.NS+"workbookPr")
+        self.bDate1904 = (wbPr != None) and (wbPr.get("date1904") in [ "1", "true" ])
+        sheet = wb.find(self.NS+"sheets").find(self.NS+"sheet")
+        rId = sheet.get(self.NSREL+"id")
+        rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+        for rel in rels:
+            if rel.get("Id") == rId:
+                target = rel.get("Target")
+                if target.startswith("/"):
+                    return target[1:]
+                return "xl/{}".format(target)
+        return "xl/worksheets/sheet1.xml"
+
+
+    def _colindex(self, sRef):
+        """ Convert the column part of a cell reference (say AB12) into a 0 based index
+            """
+        iCol = 0
+        for c in sRef:
+            if not c.isalpha():
+                break
+            iCol = iCol*26 + (ord(c.upper()) - ord('A') + 1)
+        return iCol - 1
+
+
+    def _cellvalue(self, c, lStrings):
+        sType = c.get("t")
+        if sType == "inlineStr":
+            return "".join(c.find(self.NS+"is").itertext())
+        v = c.find(self.NS+"v")
+        if (v == None) or (v.text == None):
+            return None
+        if sType == "s":
+            return lStrings[int(v.text)]
+        if sType in [ "str", "e" ]:
+            return v.text
+        if sType == "b":
+            return float(v.text != "0")
+        return float(v.text)
+
+
+    def read_cols(self, lColNames):
+        """ A generator which returns the values of the specified columns for each
+            data row in the sheet. The 1st row in the sheet is assumed to be the
+            header row, which is used to find the specified columns.
+
+            Each row is removed from its parent (sheetData) once processed, so
+            that the memory used doesnt grow with the num of rows in the sheet.
+            """
+        zf = zipfile.ZipFile(self.fileName)
+        lStrings = self._shared_strings(zf)
+        f = zf.open(self._first_sheet(zf))
+        dCols = None
+        eParent = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if elem.tag == self.NS+"sheetData":
+                    eParent = elem
+                continue
+            if elem.tag != self.NS+"row":
+                continue
+            dRow = {}
+            iCol = 0
+            for c in elem.iter(self.NS+"c"):
+                sRef = c.get("r")
+                if sRef != None:
+                    iCol = self._colindex(sRef)
+                if (dCols == None) or (iCol in dCols):
+                    dRow[iCol] = self._cellvalue(c, lStrings)
+                iCol += 1
+            elem.clear()
+            if eParent != None:
+                eParent.remove(elem)
+            if dCols == None:
+                lHdr = [ dRow.get(i) for i in range(max(dRow.keys(), default=-1)+1) ]
+                dCols = {}
+                for sCol in lColNames:
+                    if sCol not in lHdr:
+                        raise ImportError("XlsxReader:{}: No column {} in header {}".format(self.fileName, sCol, lHdr))
+                    dCols[lHdr.index(sCol)] = sCol
+                lColIndexes = [ lHdr.index(sCol) for sCol in lColNames ]
+                continue
+            lVals = [ dRow.get(i) for i in lColIndexes ]
+            if all([ x == None for x in lVals ]):
+                # Empty (may be just formatted) row
+                continue
+            yield lVals
+        f.close()
+        zf.close()
+
+
+    def conv_date_serial2int(self, fSerial):
+        """ Convert the given spreadsheet date serial into numeric YYYYMMDD
+            """
+        if self.bDate1904:
+            baseDate = calendar.datetime.date(1904, 1, 1)
+        else:
+            baseDate = calendar.datetime.date(1899, 12, 30)
+        theDate = baseDate + calendar.datetime.timedelta(days=int(fSerial))
+        return theDate.year*10000 + theDate.month*100 + theDate.day
+
+
+
 class DataSrc:
     """ The base class for downloading data and inturn loading the downloaded data
         into memory. User can use fetch_data and load_data for this.
@@ -24,6 +532,14 @@ class DataSrc:
         """
 
     bTestForceMissing = False
+    # How long (in seconds) a fetched file is used as is, before checking with the server
+    cacheTTL = 60*60
+    # Use the vectorised csv loader instead of numpy.genfromtxt
+    bFastLoad = True
+    # Cache the loaded data matrix in a memory mappable sidecar file
+    bMatCache = True
+    # Parse only the newly appended rows, if the file grew by appending to the last loaded one
+    bIncLoad = True
 
     def fix_missing_value(self, missing=numpy.NAN, value=0):
         """ Fix missing value(s) using the specified value
@@ -40,6 +556,24 @@ class DataSrc:
         return lMissing
 
 
+    def _missing_mask(self, missing=numpy.NAN):
+        """ Return a bool mask of the values in data, which are missing values.
+            """
+        if numpy.isnan(missing):
+            return numpy.isnan(self.data)
+        return (self.data == missing)
+
+
+    def _window_sum(self, aData, iNear):
+        """ Sum of the values within iNear positions on either side (inclusive),
+            along axis 0, for all positions at once using a cumulative sum.
+            """
+        aPad = numpy.zeros((1+iNear,)+aData.shape[1:])
+        aCum = numpy.cumsum(numpy.concatenate((aPad, aData, aPad[:iNear])), axis=0)
+        iWin = 2*iNear+1
+        return aCum[iWin:] - aCum[:-iWin]
+
+
     def fix_missing_localmean(self, missing=numpy.NAN, axis=0, iNear=3):
         """ Fix missing value(s) using local mean among adjacent neighbours
             Supports 2D array.
@@ -49,67 +583,170 @@ class DataSrc:
                 1: values across cols i.e in a given row
             iNear: How many neighbours to use on either side of missing value,
                 when calculating the local mean to use in place of missing value.
-            NOTE: if there are (adjacent or otherwise) missing values, then 0
-                will be used in their place, when calculating mean.
+            NOTE: The mean is calculated only over the neighbours, which are not
+                missing values. If there are no such neighbours, then 0 is used.
+
+            All the missing values are fixed at once, by dividing the window sums
+            of the data (with missing values as 0) by the window sums of the count
+            of non missing values.
             """
         if self.bTestForceMissing:
             self.data[5,0] = missing
-        lMissing = self.fix_missing_value(missing, 0)
-        for iCur in lMissing:
-            iS = iCur[axis] - iNear
-            if iS < 0:
-                iS = 0
-            iE = iCur[axis] + iNear + 1
-            if iE > self.data.shape[axis]:
-                iE = self.data.shape[axis]
-            if axis == 0:
-                tData = self.data[iS:iE, iCur[1]]
-            else:
-                tData = self.data[iCur[0], iS:iE]
-            self.data[tuple(iCur)] = 0
-            iMean = numpy.sum(tData)/(iE-iS-1)
-            print("INFO:DataSrc:fix_missing_localmean:pos={}:curarea={}:new={}".format(iCur, tData, iMean))
-            self.data[tuple(iCur)] = iMean
+        aMask = self._missing_mask(missing)
+        lMissing = numpy.argwhere(aMask)
+        if len(lMissing) == 0:
+            return lMissing
+        aMaskA = numpy.moveaxis(aMask, axis, 0)
+        aDataA = numpy.where(aMaskA, 0, numpy.moveaxis(self.data, axis, 0))
+        aSum = self._window_sum(aDataA, iNear)
+        aCnt = self._window_sum((~aMaskA).astype(float), iNear)
+        aMean = numpy.zeros(aSum.shape)
+        numpy.divide(aSum, aCnt, out=aMean, where=(aCnt > 0))
+        numpy.moveaxis(self.data, axis, 0)[aMaskA] = aMean[aMaskA]
+        print("INFO:DataSrc:fix_missing_localmean:fixed {} missing values".format(len(lMissing)))
+        return lMissing
+
+
+    def _prev_next_valid(self, aMaskA):
+        """ For each position along axis 0, find the index of the nearest non missing
+            value at or before it (-1 if none) and at or after it (len if none).
+            """
+        numPos = aMaskA.shape[0]
+        aIdx = numpy.arange(numPos).reshape((numPos,)+(1,)*(aMaskA.ndim-1))
+        aPrev = numpy.maximum.accumulate(numpy.where(aMaskA, -1, aIdx), axis=0)
+        aNext = numpy.minimum.accumulate(numpy.where(aMaskA, numPos, aIdx)[::-1], axis=0)[::-1]
+        return aIdx, aPrev, aNext
+
+
+    def fix_missing_interp(self, missing=numpy.NAN, axis=0, value=0):
+        """ Fix missing value(s) using linear interpolation between the nearest
+            non missing values on either side along the given axis. Missing values
+            at the start or end use the nearest non missing value. If there are no
+            non missing values along the axis, then value is used.
+            """
+        aMask = self._missing_mask(missing)
+        lMissing = numpy.argwhere(aMask)
+        if len(lMissing) == 0:
+            return lMissing
+        aMaskA = numpy.moveaxis(aMask, axis, 0)
+        aDataA = numpy.moveaxis(self.data, axis, 0)
+        numPos = aMaskA.shape[0]
+        aIdx, aPrev, aNext = self._prev_next_valid(aMaskA)
+        aHasPrev = (aPrev >= 0)
+        aHasNext = (aNext < numPos)
+        aPrevC = numpy.clip(aPrev, 0, numPos-1)
+        aNextC = numpy.clip(aNext, 0, numPos-1)
+        aPrevV = numpy.take_along_axis(aDataA, aPrevC, axis=0).astype(float)
+        aNextV = numpy.take_along_axis(aDataA, aNextC, axis=0).astype(float)
+        aSpan = numpy.where(aNext > aPrev, aNext - aPrev, 1)
+        aNew = aPrevV + (aNextV - aPrevV)*(aIdx - aPrev)/aSpan
+        aNew = numpy.where(aHasPrev & ~aHasNext, aPrevV, aNew)
+        aNew = numpy.where(~aHasPrev & aHasNext, aNextV, aNew)
+        aNew = numpy.where(~aHasPrev & ~aHasNext, value, aNew)
+        aDataA[aMaskA] = aNew[aMaskA]
+        print("INFO:DataSrc:fix_missing_interp:fixed {} missing values".format(len(lMissing)))
+        return lMissing
+
+
+    def fix_missing_ffill(self, missing=numpy.NAN, axis=0, value=0):
+        """ Fix missing value(s) using the nearest non missing value before it along
+            the given axis (forward fill). Missing values at the start use value.
+            """
+        aMask = self._missing_mask(missing)
+        lMissing = numpy.argwhere(aMask)
+        if len(lMissing) == 0:
+            return lMissing
+        aMaskA = numpy.moveaxis(aMask, axis, 0)
+        aDataA = numpy.moveaxis(self.data, axis, 0)
+        aIdx, aPrev, aNext = self._prev_next_valid(aMaskA)
+        aPrevV = numpy.take_along_axis(aDataA, numpy.clip(aPrev, 0, None), axis=0)
+        aNew = numpy.where(aPrev >= 0, aPrevV, value)
+        aDataA[aMaskA] = aNew[aMaskA]
+        print("INFO:DataSrc:fix_missing_ffill:fixed {} missing values".format(len(lMissing)))
+        return lMissing
 
 
     def fix_missing(self, fixMissing=None):
         """ fix missing values if required as specified
-            fixMissing: None or { "type": <type>, "missing": <missing>, "value": <value> }
-                <type>: "value" or "localmean" or "none"
+            fixMissing: None or { "type": <type>, "missing": <missing>, "value": <value>, "axis": <axis>, "near": <near> }
+                <type>: "value" or "localmean" or "interp" or "ffill" or "none"
                     if  "value" give <missing> and <value>
-                    if "localmean" give <missing>
+                    if "localmean" give <missing>, optionally <axis> and <near>
+                    if "interp" or "ffill" give <missing>, optionally <axis> and <value>
                     if "none" do nothing
                 <missing>: the value in the data to be treated as missing value
                 <value>: the value to use in place of missing value
+                    (for interp/ffill, when there is no non missing value to use)
+                <axis>: 0 (default) to fix using values in the same col, 1 for same row
+                <near>: num of neighbours on either side used by localmean (default 3)
             """
         if fixMissing != None:
+            iAxis = fixMissing.get("axis", 0)
             if fixMissing["type"] == "localmean":
-                self.fix_missing_localmean(missing=fixMissing["missing"])
+                self.fix_missing_localmean(missing=fixMissing["missing"], axis=iAxis, iNear=fixMissing.get("near", 3))
             elif fixMissing["type"] == "value":
                 self.fix_missing_value(missing=fixMissing["missing"], value=fixMissing["value"])
+            elif fixMissing["type"] == "interp":
+                self.fix_missing_interp(missing=fixMissing["missing"], axis=iAxis, value=fixMissing.get("value", 0))
+            elif fixMissing["type"] == "ffill":
+                self.fix_missing_ffill(missing=fixMissing["missing"], axis=iAxis, value=fixMissing.get("value", 0))
             elif fixMissing["type"] == "None":
                 pass
             else:
                 raise NotImplementedError("DataSrc:fix_missing:type:{}".format(fixMissing["type"]))
 
 
-    def download(self, theUrl = None, localFileName = None):
-        """ Download the specified url into specified local file. wget is used for download.
+    def download(self, theUrl = None, localFileName = None, bConditional=False):
+        """ Download the specified url into specified local file. A in-process
+            http downloader (gDownloader) is used, which reuses connections.
+            The downloaded file is added to the download cache (gDownloadCache).
 
             theUrl: The url to use, if not given same is picked from url instance variable
                 in the class instance.
             localFileName: The local file name to store into, if not given same is picked
                 from localFileName instance variable in the class instance.
+            bConditional: If True and the local file already exists, then a conditional
+                GET is done using the validators saved in the download cache (or its
+                modification time, if no validators are available).
+
+            Returns True if new data was downloaded, False if the server reported that
+            the document has not changed or if the downloaded content is same as the
+            content of the local file.
             """
         if theUrl == None:
             theUrl = self.url
         if localFileName == None:
             localFileName = self.localFileName
+        etag, lastModified = None, None
+        dEntry = gDownloadCache.get_entry(localFileName)
+        bExists = os.path.exists(localFileName)
+        if bConditional and bExists:
+            etag = dEntry.get("etag")
+            lastModified = dEntry.get("lastModified")
+            if (etag == None) and (lastModified == None):
+                lastModified = email.utils.formatdate(os.path.getmtime(localFileName), usegmt=True)
+        dUrlEntry = {}
+        if not bExists:
+            # Content fetched from same url for a different local file (say a different day)
+            dUrlEntry = gDownloadCache.get_url_entry(theUrl)
+            etag = dUrlEntry.get("etag")
+            lastModified = dUrlEntry.get("lastModified")
         print("INFO:DataSrc:{}:downloading...".format(theUrl))
-        tCmd = [ "wget", theUrl, "--output-document={}"]
-        tCmd[2] = tCmd[2].format(localFileName)
-        if subprocess.call(tCmd) != 0:
-            raise ConnectionError("DataSrc:{}: Download data from net failed".format(theUrl))
+        bModified, etag, lastModified = gDownloader.get(theUrl, localFileName, etag, lastModified)
+        if (not bModified) and (not bExists):
+            gDownloadCache.link(gDownloadCache.obj_filename(dUrlEntry["hash"]), localFileName)
+            dEntry["hash"] = dUrlEntry["hash"]
+        dEntry.update({ "url": theUrl, "etag": etag, "lastModified": lastModified, "fetchTime": time.time() })
+        if bModified or ("hash" not in dEntry):
+            sHash = gDownloadCache.add_file(localFileName)
+            if bModified and bExists and (sHash == dEntry.get("hash")):
+                print("INFO:DataSrc:{}:downloaded content same as before".format(theUrl))
+                bModified = False
+            dEntry["hash"] = sHash
+        gDownloadCache.put_entry(localFileName, dEntry)
+        if not bModified:
+            print("INFO:DataSrc:{}:not modified".format(theUrl))
+        return bModified
 
 
     def _fix_url_filenames(self):
@@ -144,17 +781,32 @@ class DataSrc:
             self.fd_year = year
 
 
-    def _fetch_data(self, day=None, month=None, year=None):
-        """ fetch/download data if not already downloaded/available.
-            It calls helper functions to setup the fetch date, as well as
-            the url, local file name and file type of fetched data.
+    def _fetch_file(self, theUrl, localFileName):
+        """ fetch/download the given url into localFileName, if not already
+            downloaded/available.
+
+            If the file was already downloaded within the last cacheTTL seconds, it
+            is used as is. Else a conditional GET is used to check if the data has
+            changed. If it hasnt changed (or if the server cant be reached), the
+            already downloaded file is used.
+
+            Returns True if the already downloaded file is being reused as is,
+            else False.
+
+            NOTE: This doesnt modify the class instance, so it can be called in
+            parallel for different urls/files.
             """
-        self._set_fetch_date(day, month, year)
-        self._fix_url_filenames()
-        if os.path.exists(self.localFileName) and (os.path.getsize(self.localFileName)>128):
-            print("INFO:DataSrc:{}:already downloaded".format(self.localFileName))
-            return True
-        self.download()
+        if os.path.exists(localFileName) and (os.path.getsize(localFileName)>128):
+            if gDownloadCache.is_fresh(localFileName, self.cacheTTL):
+                print("INFO:DataSrc:{}:already downloaded and fresh".format(localFileName))
+                return True
+            try:
+                return not self.download(theUrl, localFileName, bConditional=True)
+            except ConnectionError as e:
+                print("WARN:DataSrc:{}:using already downloaded file:{}".format(localFileName, e))
+                return True
+        self.download(theUrl, localFileName)
+        return False
 
 
     def conv_xls2csv(self, xls, csv):
@@ -164,30 +816,50 @@ class DataSrc:
             raise OSError("DataSrc:ConvXls2Csv:{}".format(tCmd))
 
 
-    def _fetchconv_postproc(self):
+    def _fetchconv_postproc(self, xlsxFileName=None):
         """ Child class can add additional logic to help process fetched data by implementing
             this function.
             This is automatically called if xls to csv conversion of datasrc base class is used,
             which occurs after a download, if localFileType is set to "xls".
             Similarly if localFileType is set to "proc", then also this will be called.
+
+            xlsxFileName: If the fetched file is a xlsx file, then it is not converted to csv,
+                instead its name is passed here, so that the required data can be read from
+                it directly using XlsxReader. The processed data should be saved into the
+                csv file specified by localFileName.
             """
         raise NotImplementedError("DataSrc:_fetchconv_postproc: of data fetched and or converted to csv...")
 
 
+    def _convdata_filename(self):
+        """ Return the name of the file, which will contain the data, after
+            conv_data has processed the fetched file.
+            """
+        if self.localFileType == "xls":
+            (tBase, tExt) = os.path.splitext(self.localFileName)
+            return "{}.csv".format(tBase)
+        return self.localFileName
+
+
     def conv_data(self):
         """ Automatically called by fetch_data, after data has been fetched.
             It uses the self.localFileType instance variable to decide what to do.
                 if "xls", then fetched xls file is converted to csv format.
                     This also triggers the "proc" logic mentioned below.
+                    If it is a xlsx file, then instead of converting it to csv,
+                    _fetchconv_postproc is called with the xlsx file name, so
+                    that it can read the required data directly from it.
                 if "proc", then _fetchconv_postproc helper is called.
             """
         if self.localFileType == "xls":
             xlsFN = self.localFileName
-            (tBase, tExt) = os.path.splitext(xlsFN)
-            csvFN = "{}.csv".format(tBase)
-            self.conv_xls2csv(xlsFN, csvFN)
+            csvFN = self._convdata_filename()
             self.localFileName = csvFN
             self.localFileType = "proc"
+            if XlsxReader.is_xlsx(xlsFN):
+                self._fetchconv_postproc(xlsFN)
+                return
+            self.conv_xls2csv(xlsFN, csvFN)
 
         if self.localFileType == "proc":
             self._fetchconv_postproc()
@@ -211,27 +883,110 @@ class DataSrc:
         raise ValueError("DataSrc:_prev_day:DBG: Couldnt find valid prev day for {}-{}-{}".format(year, month, day))
 
 
+    def _fetch_dates(self, day, month, year, numDays=4):
+        """ Return the list of (day, month, year) dates to try fetching data for,
+            starting with the given date followed by the previous dates.
+            """
+        self._set_fetch_date(day, month, year)
+        lDates = [ (self.fd_day, self.fd_month, self.fd_year) ]
+        for i in range(numDays-1):
+            lDates.append(self._prev_day(*lDates[-1]))
+        return lDates
+
+
+    def _fetch_data_parallel(self, day=None, month=None, year=None, numDays=4):
+        """ Find the newest among the given date and numDays-1 previous dates, for
+            which data is available, and fetch its data.
+
+            The dates whose data is not already downloaded are probed in parallel
+            (HEAD or a 1 byte Range GET, see HttpDownloader.probe), so that only
+            the data of the selected date is actually downloaded. If its fetch
+            fails, then the next older available date is tried.
+
+            If the url doesnt change with the date (like for Cov19In), then it is
+            fetched only once.
+            """
+        lFetches = []
+        lUrls = []
+        for (d, m, y) in self._fetch_dates(day, month, year, numDays):
+            self._set_fetch_date(d, m, y)
+            self._fix_url_filenames()
+            if self.url in lUrls:
+                continue
+            lUrls.append(self.url)
+            lFetches.append(((d, m, y), self.url, self.localFileName))
+        def probe(theUrl, localFileName):
+            if os.path.exists(localFileName) and (os.path.getsize(localFileName)>128):
+                return True
+            try:
+                return gDownloader.probe(theUrl)
+            except ConnectionError as e:
+                print("INFO:DataSrc:fetch_data: Failed probing {}:{}".format(theUrl, e))
+                return False
+        if len(lFetches) > 1:
+            with concurrent.futures.ThreadPoolExecutor(len(lFetches)) as ex:
+                lAvail = list(ex.map(lambda x: probe(x[1], x[2]), lFetches))
+        else:
+            lAvail = [ True ]
+        for (date, theUrl, localFileName), bAvail in zip(lFetches, lAvail):
+            if not bAvail:
+                print("INFO:DataSrc:fetch_data: No data for {}-{}-{}".format(date[2], date[1], date[0]))
+                continue
+            try:
+                self._fetch_file(theUrl, localFileName)
+            except ConnectionError as e:
+                print("INFO:DataSrc:fetch_data: Failed fetching data for {}-{}-{}:{}".format(date[2], date[1], date[0], e))
+                continue
+            self._set_fetch_date(*date)
+            self._fix_url_filenames()
+            self.fetchFileName = self.localFileName
+            return True
+        raise ConnectionError("DataSrc:fetch_data: Failed fetching data for {}".format(lUrls))
+
+
+    def _reuse_convdata(self):
+        """ If the download cache already has the converted data for the content
+            of the fetched file, then reuse it instead of calling conv_data.
+            """
+        objFileName = gDownloadCache.get_conv(self.name, self.fetchFileName)
+        if objFileName == None:
+            return False
+        convFN = self._convdata_filename()
+        gDownloadCache.link(objFileName, convFN)
+        print("INFO:DataSrc:{}:reusing cached converted data {}".format(self.fetchFileName, convFN))
+        self.localFileName = convFN
+        self.localFileType = "csv"
+        return True
+
+
     def fetch_data(self, day=None, month=None, year=None):
         """ Called by user to fetch data, ideally belonging to the given date.
             If there is no data available for a given date, then it automatically
             tries to fetch data for the previous date (upto 4 prev dates are tried).
+            The given and previous dates are probed in parallel and the newest date
+            for which data is available is used.
 
             After the data is fetched, it automatically calls conv_data. Which inturn
             may call child class's _fetchconv_postproc, if required.
+
+            If the content of the fetched file was already converted before (may be
+            on a different day), then the cached converted data is reused and conv_data
+            is skipped.
             """
-        for i in range(4):
-            try:
-                self._fetch_data(day, month, year)
-                break
-            except ConnectionError:
-                day, month, year = self._prev_day(self.fd_day, self.fd_month, self.fd_year)
-                print("INFO:DataSrc:fetch_data: Failed fetching data for {}-{}-{}, so trying for {}-{}-{}".format(self.fd_year, self.fd_month, self.fd_day, year, month, day))
+        self._fetch_data_parallel(day, month, year)
+        if self._reuse_convdata():
+            return
+        convFN = self._convdata_filename()
+        if (convFN != self.fetchFileName) and os.path.exists(convFN):
+            # It may be a link to a cached object, so dont let conversion overwrite it
+            os.remove(convFN)
         self.conv_data()
+        gDownloadCache.add_conv(self.name, self.fetchFileName, self.localFileName)
 
 
     def conv_date_str2int(self, sDate, delimiter="-", iY = 0, iM=1, iD=2, mType="int", bYear2Digit=False):
         """ Helper to convert date in string format to numeric YYYYMMDD
-            sDate: the date in string format
+            sDate: the date in string (or bytes) format
             delimiter: the delimiter used to differentiate between date, month and year in string.
             iY, iM, iD: specify the location of year, month and date in the string.
             mType: Check if month is specified as a abbrevation or number in the string.
@@ -239,7 +994,8 @@ class DataSrc:
                 anything else: jan - january, apr - april, dec - december.
             bYear2Digit: If true, then year will be in YY format, else YYYY format.
             """
-        sDate = sDate.decode('utf-8')
+        if type(sDate) == bytes:
+            sDate = sDate.decode('utf-8')
         sDate = sDate.split(delimiter)
         iDate = int(sDate[iY])*10000
         if bYear2Digit:
@@ -252,6 +1008,193 @@ class DataSrc:
         return iDate
 
 
+    def conv_dates_str2int(self, aDates, delimiter="-", iY = 0, iM=1, iD=2, mType="int", bYear2Digit=False):
+        """ Vectorised version of conv_date_str2int, which converts a array of dates
+            in string format into a array of numeric YYYYMMDD.
+            Each unique date string is parsed only once, using numpy string ops.
+            The arguments have the same meaning as in conv_date_str2int.
+            """
+        aUniq, aInv = numpy.unique(aDates, return_inverse=True)
+        aP1 = numpy.char.partition(numpy.char.strip(aUniq), delimiter)
+        aP2 = numpy.char.partition(aP1[:,2], delimiter)
+        lParts = [ aP1[:,0], aP2[:,0], aP2[:,2] ]
+        aDate = lParts[iY].astype(int)*10000
+        if bYear2Digit:
+            aDate += 20000000
+        if mType == "int":
+            aDate += lParts[iM].astype(int)*100
+        else:
+            dMonths = { sMonth: i for i, sMonth in enumerate(calendar.month_abbr) }
+            aDate += numpy.array([ dMonths[sMonth] for sMonth in lParts[iM] ], dtype=int)*100
+        aDate += lParts[iD].astype(int)
+        return aDate[aInv.reshape(-1)]
+
+
+    def _conv_missing(self, aNum, dtype):
+        """ Convert the given float array into the given dtype. If dtype is int,
+            missing values (nan) become -1 (same as genfromtxt).
+            """
+        if numpy.dtype(dtype).kind in "iu":
+            aNum[numpy.isnan(aNum)] = -1
+        return aNum.astype(dtype)
+
+
+    def _conv_numeric(self, aCol, dtype):
+        """ Convert the given array of strings into numbers in bulk. Empty and
+            non numeric values are treated as missing values.
+            """
+        aCol = numpy.char.strip(aCol)
+        aCol[aCol == ""] = "nan"
+        try:
+            aNum = aCol.astype(float)
+        except ValueError:
+            # Handle the non numeric values, by converting each unique value once
+            aUniq, aInv = numpy.unique(aCol, return_inverse=True)
+            aUNum = numpy.empty(len(aUniq))
+            for i in range(len(aUniq)):
+                try:
+                    aUNum[i] = float(aUniq[i])
+                except ValueError:
+                    aUNum[i] = numpy.nan
+            aNum = aUNum[aInv.reshape(-1)]
+        return self._conv_missing(aNum, dtype)
+
+
+    def _is_numeric(self, sVal):
+        try:
+            float(sVal)
+            return True
+        except ValueError:
+            return False
+
+
+    def _fill_empty_fields(self, sText, delimiter):
+        """ Fill the empty fields in the given csv text with nan, so that the
+            text can be parsed by numpy.loadtxt.
+            """
+        sText = sText.replace("\r\n", "\n")
+        if not sText.endswith("\n"):
+            sText += "\n"
+        sDD = delimiter+delimiter
+        sDNaND = delimiter+"nan"+delimiter
+        while sText.find(sDD) != -1:
+            sText = sText.replace(sDD, sDNaND)
+        sText = sText.replace(delimiter+"\n", delimiter+"nan\n")
+        sText = sText.replace("\n"+delimiter, "\nnan"+delimiter)
+        if sText.startswith(delimiter):
+            sText = "nan"+sText
+        return sText
+
+
+    def _load_csv_strarray(self, sText, dtype=float, delimiter=None, skip_header=None, colConverters=None, usecols=None):
+        """ Split the csv text into a 2D array of strings and inturn convert each
+            column in bulk. Handles ragged rows (missing trailing fields) and non
+            numeric values anywhere.
+            """
+        lLines = sText.splitlines()
+        if skip_header != None:
+            lLines = lLines[skip_header:]
+        lRows = [ l.split(delimiter) for l in lLines if (l.strip() != "") and (not l.startswith("#")) ]
+        numCols = max([ len(r) for r in lRows ])
+        for r in lRows:
+            if len(r) < numCols:
+                r.extend([""]*(numCols-len(r)))
+        aStr = numpy.array(lRows, dtype=str).reshape(len(lRows), numCols)
+        if usecols == None:
+            usecols = range(numCols)
+        data = numpy.empty((aStr.shape[0], len(usecols)), dtype=dtype)
+        for iOut, iCol in enumerate(usecols):
+            if iCol in colConverters:
+                data[:,iOut] = colConverters[iCol](aStr[:,iCol])
+            else:
+                data[:,iOut] = self._conv_numeric(aStr[:,iCol], dtype)
+        return data
+
+
+    def _load_csv_fast(self, fileName, dtype=float, delimiter=None, skip_header=None, colConverters=None, usecols=None, sText=None):
+        """ A fast alternative to numpy.genfromtxt with per value converters.
+
+            The numeric columns are parsed in bulk using the C based numpy.loadtxt.
+            The columns which have colConverters (and the non numeric columns) are
+            read as strings in bulk and inturn converted a full column at a time.
+
+            colConverters: dict of file column index to a function, which converts
+                the full column (array of strings) into a array of numbers.
+
+            Numeric columns are identified based on the 1st data row. If the file
+            doesnt fit this (ragged rows or unexpected non numeric values), then
+            it falls back to _load_csv_strarray.
+
+            sText: if given, the csv content is taken from it instead of the file.
+            """
+        if skip_header == None:
+            skip_header = 0
+        if colConverters == None:
+            colConverters = {}
+        if sText == None:
+            f = open(fileName)
+            sText = f.read()
+            f.close()
+        if delimiter == None:
+            return self._load_csv_strarray(sText, dtype, delimiter, skip_header, colConverters, usecols)
+        sText = self._fill_empty_fields(sText, delimiter)
+        lFirst = None
+        for l in sText.split("\n", skip_header+64)[skip_header:]:
+            if (l.strip() != "") and (not l.startswith("#")):
+                lFirst = l.split(delimiter)
+                break
+        if lFirst == None:
+            return numpy.empty((0, 0), dtype=dtype)
+        if usecols == None:
+            usecols = range(len(lFirst))
+        lStrCols = [ i for i in usecols if (i in colConverters) or (not self._is_numeric(lFirst[i])) ]
+        lNumCols = [ i for i in usecols if i not in lStrCols ]
+        try:
+            if len(lNumCols) > 0:
+                aNum = numpy.loadtxt(io.StringIO(sText), dtype=float, delimiter=delimiter, skiprows=skip_header, usecols=lNumCols, ndmin=2)
+            if len(lStrCols) > 0:
+                aStr = numpy.loadtxt(io.StringIO(sText), dtype=str, delimiter=delimiter, skiprows=skip_header, usecols=lStrCols, ndmin=2)
+        except ValueError as e:
+            print("WARN:DataSrc:_load_csv_fast:{}:falling back to slower path:{}".format(fileName, e))
+            return self._load_csv_strarray(sText, dtype, delimiter, skip_header, colConverters, usecols)
+        if len(lNumCols) > 0:
+            numRows = aNum.shape[0]
+        else:
+            numRows = aStr.shape[0]
+        data = numpy.empty((numRows, len(usecols)), dtype=dtype)
+        for iOut, iCol in enumerate(usecols):
+            if iCol in lNumCols:
+                data[:,iOut] = self._conv_missing(aNum[:,lNumCols.index(iCol)], dtype)
+            elif iCol in colConverters:
+                data[:,iOut] = colConverters[iCol](aStr[:,lStrCols.index(iCol)])
+            else:
+                data[:,iOut] = self._conv_numeric(aStr[:,lStrCols.index(iCol)], dtype)
+        return data
+
+
+    def _iter_csv_rows(self, fileName, lFields, delimiter=","):
+        """ A generator which returns the values (as strings) of the specified
+            columns for each data row in the given csv file, read in a single pass.
+            The 1st line is the header, which is used to find the columns. Quoted
+            fields are handled by the csv module, any delimiter within them is
+            replaced with '_'.
+            """
+        f = open(fileName, newline="")
+        rdr = csv.reader(f, delimiter=delimiter)
+        hdr = [ sCol.strip() for sCol in next(rdr) ]
+        for sField in lFields:
+            if sField not in hdr:
+                f.close()
+                raise ImportError("DataSrc:{}: No column {} in header {}".format(fileName, sField, hdr))
+        cols = [ hdr.index(sField) for sField in lFields ]
+        iMaxCol = max(cols)
+        for lRow in rdr:
+            if len(lRow) <= iMaxCol:
+                continue
+            yield [ lRow[i].replace(delimiter, "_") for i in cols ]
+        f.close()
+
+
     def _load_hdr(self, fileName, delimiter, iHdrLine):
         """ A helper function used to extract the header in the specified data file.
             It uses the delimiter and header line info specified to extract the same.
@@ -266,21 +1209,486 @@ class DataSrc:
         raise ImportError("DataSrc:_load_hdr: No header found")
 
 
-    def load_data(self, fileName=None, dtype=float, delimiter=None, skip_header=None, converters=None, iHdrLine=None, usecols=None, fixMissing=None):
+    def _catencoder_filename(self, sField):
+        """ The file, along side the download cache, used to persist the codes
+            of the categorical encoder of the given field of this data source.
+            """
+        return os.path.join(gDownloadCache.cacheDir, "{}-{}.codes.json".format(self.name, sField))
+
+
+    def load_catencoder(self, sField):
+        """ Return a categorical encoder for the given field, which is loaded
+            with the codes persisted for this data source, if any.
+            """
+        enc = CatEncoder()
+        enc.load(self._catencoder_filename(sField))
+        return enc
+
+
+    def save_catencoder(self, sField, enc):
+        """ Persist the codes of the given categorical encoder.
+            """
+        try:
+            os.makedirs(gDownloadCache.cacheDir, exist_ok=True)
+            enc.save(self._catencoder_filename(sField))
+        except OSError as e:
+            print("WARN:DataSrc:save_catencoder:{}:{}".format(sField, e))
+
+
+    def _matcache_filenames(self, fileName):
+        """ The sidecar files used to cache the loaded data matrix and its meta data
+            """
+        return "{}.npy".format(fileName), "{}.npy.json".format(fileName)
+
+
+    def _load_matcache(self, fileName, sParams):
+        """ Load the data matrix (memory mapped) and header of the given file from its
+            sidecar cache files, provided they were created with the same load params
+            from the same content (checked using size and mtime, else the content hash).
+            Returns True if loaded from the cache.
+            """
+        npyFN, metaFN = self._matcache_filenames(fileName)
+        try:
+            f = open(metaFN)
+            dMeta = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            return False
+        if dMeta.get("params") != sParams:
+            return False
+        st = os.stat(fileName)
+        if (dMeta.get("srcSize") != st.st_size) or (dMeta.get("srcMTime") != st.st_mtime_ns):
+            if dMeta.get("srcHash") != hash_file(fileName):
+                return False
+        try:
+            data = numpy.load(npyFN, mmap_mode="c")
+        except (OSError, ValueError):
+            return False
+        print("INFO:DataSrc:Loading:{}:using cached matrix {}".format(fileName, npyFN))
+        self.data = data
+        for sAttr in dMeta["attrs"]:
+            setattr(self, sAttr, dMeta["attrs"][sAttr])
+        return True
+
+
+    def _save_matcache(self, fileName, sParams):
+        """ Save the loaded data matrix and header of the given file into its sidecar
+            cache files, so that later loads can memory map it.
+            """
+        npyFN, metaFN = self._matcache_filenames(fileName)
+        st = os.stat(fileName)
+        dAttrs = {}
+        if hasattr(self, "hdr"):
+            dAttrs["hdr"] = list(self.hdr)
+        dMeta = { "params": sParams, "srcSize": st.st_size, "srcMTime": st.st_mtime_ns, "srcHash": hash_file(fileName), "attrs": dAttrs }
+        try:
+            f = open("{}.tmp".format(npyFN), "wb")
+            numpy.save(f, self.data)
+            f.close()
+            os.replace("{}.tmp".format(npyFN), npyFN)
+            f = open("{}.tmp".format(metaFN), "w")
+            json.dump(dMeta, f)
+            f.close()
+            os.replace("{}.tmp".format(metaFN), metaFN)
+        except OSError as e:
+            print("WARN:DataSrc:_save_matcache:{}:{}".format(fileName, e))
+
+
+    def _ingest_filename(self):
+        """ The file, along side the download cache, which remembers what was
+            ingested by the last full or incremental load of this data source.
+            """
+        return os.path.join(gDownloadCache.cacheDir, "{}.ingest.json".format(self.name))
+
+
+    def _hash_prefix(self, f, numBytes):
+        """ sha256 of the first numBytes of the given (binary mode) file, which
+            is left positioned at numBytes.
+            """
+        h = hashlib.sha256()
+        iLeft = numBytes
+        while iLeft > 0:
+            bData = f.read(min(iLeft, 1024*1024))
+            if len(bData) == 0:
+                break
+            h.update(bData)
+            iLeft -= len(bData)
+        return h.hexdigest()
+
+
+    def _save_ingest(self, fileName, sParams):
+        """ Remember the file, its size (byte offset upto which it was ingested),
+            the hash of its content, num of rows and the last date ingested, so
+            that a later load of a file, which has new rows appended to it, can
+            parse only the new rows.
+            The file should end with a newline, else nothing is remembered.
+            """
+        ingestFN = self._ingest_filename()
+        f = open(fileName, "rb")
+        f.seek(0, os.SEEK_END)
+        numBytes = f.tell()
+        if numBytes > 0:
+            f.seek(numBytes-1)
+            bEndsWithNL = (f.read(1) == b"\n")
+        else:
+            bEndsWithNL = False
+        if not bEndsWithNL or (len(self.data) == 0):
+            f.close()
+            if os.path.exists(ingestFN):
+                os.remove(ingestFN)
+            return
+        f.seek(0)
+        sHash = self._hash_prefix(f, numBytes)
+        f.close()
+        dAttrs = {}
+        if hasattr(self, "hdr"):
+            dAttrs["hdr"] = list(self.hdr)
+        dIngest = { "params": sParams, "fileName": fileName, "numBytes": numBytes, "prefixHash": sHash, "numRows": len(self.data), "lastDate": float(self.data[-1,0]), "attrs": dAttrs }
+        try:
+            os.makedirs(gDownloadCache.cacheDir, exist_ok=True)
+            f = open("{}.tmp".format(ingestFN), "w")
+            json.dump(dIngest, f)
+            f.close()
+            os.replace("{}.tmp".format(ingestFN), ingestFN)
+        except OSError as e:
+            print("WARN:DataSrc:_save_ingest:{}:{}".format(fileName, e))
+
+
+    def _load_incremental(self, fileName, sParams, dtype, delimiter, colConverters, usecols, fixMissing):
+        """ If the given file is the last ingested file with new rows appended to
+            it, then load the cached matrix of the last ingested file and append
+            to it the rows got by parsing only the new tail of the given file.
+
+            Falls back (returns False), if the load params differ, the file doesnt
+            start with the exact bytes ingested last time (i.e earlier rows were
+            revised), the new rows arent dated on or after the last ingested date
+            (1st column) or the cached matrix is not available. Also fixMissing
+            types which depend on neighbouring values (localmean) need a full load.
+            """
+        try:
+            f = open(self._ingest_filename())
+            dIngest = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            return False
+        if dIngest.get("params") != sParams:
+            return False
+        if (fixMissing != None) and (fixMissing["type"] not in [ "value", "None" ]):
+            return False
+        numBytes = dIngest["numBytes"]
+        if os.path.getsize(fileName) < numBytes:
+            return False
+        f = open(fileName, "rb")
+        sHash = self._hash_prefix(f, numBytes)
+        bTail = f.read()
+        f.close()
+        if sHash != dIngest["prefixHash"]:
+            return False
+        npyFN, metaFN = self._matcache_filenames(dIngest["fileName"])
+        try:
+            oldData = numpy.load(npyFN, mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        if len(oldData) != dIngest["numRows"]:
+            return False
+        print("INFO:DataSrc:Loading:{}:incremental, parsing {} new bytes after {}".format(fileName, len(bTail), dIngest["fileName"]))
+        sText = bTail.decode()
+        if sText.strip() != "":
+            self.data = self._load_csv_fast(fileName, dtype=dtype, delimiter=delimiter, skip_header=0, colConverters=colConverters, usecols=usecols, sText=sText)
+            if (len(self.data) > 0) and ((self.data.shape[1] != oldData.shape[1]) or (self.data[:,0].min() < dIngest["lastDate"])):
+                print("WARN:DataSrc:_load_incremental:{}: new rows dont fit, doing full load".format(fileName))
+                return False
+            self.fix_missing(fixMissing)
+            self.data = store_array(numpy.concatenate((oldData, self.data)), bIntIfIntegral=True)
+        else:
+            self.data = numpy.array(oldData)
+        for sAttr in dIngest["attrs"]:
+            setattr(self, sAttr, dIngest["attrs"][sAttr])
+        return True
+
+
+    def load_data(self, fileName=None, dtype=float, delimiter=None, skip_header=None, converters=None, iHdrLine=None, usecols=None, fixMissing=None, colConverters=None, bMatCache=None):
         """ load data from specified csv file
             iHdrLine: the column header line among the skip_header lines, starts at 0
             fixMissing: None or as specified by fix_missing function
+            converters: per value converters used by numpy.genfromtxt
+            colConverters: per column (vectorised) converters used by the fast loader
+            bMatCache: whether to use the memory mapped sidecar cache of the loaded
+                data matrix and header. If None, then bMatCache class variable decides.
+
+            If bFastLoad is True, the fast loader (_load_csv_fast) is used, unless
+            converters are given without matching colConverters. Else numpy.genfromtxt
+            is used.
+
+            The loaded data (after fixing missing values) along with header is saved
+            into <fileName>.npy and <fileName>.npy.json. Later loads of the same content
+            with the same arguments memory map the saved data, instead of parsing the
+            file again. The memory mapping is copy on write, so the data can still be
+            modified in memory.
+
+            The loaded data is stored as per the dtype policy (see helpers.set_dtype_policy),
+            so in compact mode, integral data (say case counts) is stored as int32 and
+            other data as float32.
+
+            If bIncLoad is True (and bMatCache), then a file which is the last loaded
+            file of this data source with new rows appended to it (the daily growing
+            full history files), is loaded by parsing only the new rows and appending
+            them to the cached matrix of the last loaded file. If earlier rows were
+            revised, then a full load is done.
             """
         if fileName == None:
             fileName = self.localFileName
+        if bMatCache == None:
+            bMatCache = self.bMatCache
+        sParams = repr((self.__class__.__name__, numpy.dtype(dtype).str, delimiter, skip_header, iHdrLine, usecols, fixMissing, get_dtype_policy()))
+        if bMatCache and self._load_matcache(fileName, sParams):
+            return
+        bFast = self.bFastLoad and ((converters == None) or (colConverters != None))
+        if bMatCache and bFast and self.bIncLoad:
+            if self._load_incremental(fileName, sParams, dtype, delimiter, colConverters, usecols, fixMissing):
+                self._save_matcache(fileName, sParams)
+                self._save_ingest(fileName, sParams)
+                return
         print("INFO:DataSrc:Loading:{}".format(fileName))
-        self.data = numpy.genfromtxt(fileName, dtype = dtype, delimiter=delimiter, skip_header=skip_header, converters=converters, usecols=usecols)
+        if bFast:
+            self.data = self._load_csv_fast(fileName, dtype=dtype, delimiter=delimiter, skip_header=skip_header, colConverters=colConverters, usecols=usecols)
+        else:
+            self.data = numpy.genfromtxt(fileName, dtype = dtype, delimiter=delimiter, skip_header=skip_header, converters=converters, usecols=usecols)
         self.fix_missing(fixMissing)
+        self.data = store_array(self.data, bIntIfIntegral=True)
         if (skip_header != None) and (iHdrLine != None):
             if (iHdrLine < skip_header):
                 self.hdr = self._load_hdr(fileName, delimiter, iHdrLine)
             else:
                 raise ImportError("DataSrc:load_data: HeaderLine {} >= SkipHeader {}".format(iHdrLine, skip_header))
+        if bMatCache:
+            self._save_matcache(fileName, sParams)
+            if bFast and self.bIncLoad:
+                self._save_ingest(fileName, sParams)
+
+
+
+class CatEncoder:
+    """ A dict backed categorical encoder, which maps string values (say region
+        ids) to int codes in amortised O(1). Codes are assigned in the order in
+        which new values are seen and they dont change once assigned.
+
+        The encoder can be saved and loaded, so that the same codes are used
+        across different snapshots of the data.
+        """
+
+    def __init__(self, lValues=None):
+        self.lValues = []
+        self.dCodes = {}
+        if lValues != None:
+            for sValue in lValues:
+                self.encode(sValue)
+
+
+    def __len__(self):
+        return len(self.lValues)
+
+
+    def encode(self, sValue):
+        """ Return the code of the given value, adding it if not yet known
+            """
+        if type(sValue) == bytes:
+            sValue = sValue.decode()
+        iCode = self.dCodes.get(sValue)
+        if iCode == None:
+            iCode = len(self.lValues)
+            self.dCodes[sValue] = iCode
+            self.lValues.append(sValue)
+        return iCode
+
+
+    def encode_array(self, aValues):
+        """ Encode a array of values. Each unique value is looked up once and
+            new values are added in the order in which they first appear.
+            """
+        aUniq, aFirst, aInv = numpy.unique(aValues, return_index=True, return_inverse=True)
+        aCodes = numpy.empty(len(aUniq), dtype=int)
+        for i in numpy.argsort(aFirst):
+            aCodes[i] = self.encode(str(aUniq[i]))
+        return aCodes[aInv.reshape(-1)]
+
+
+    def decode(self, iCode):
+        return self.lValues[iCode]
+
+
+    def load(self, fileName):
+        """ Load the values (in code order) saved in the given file, if it exists.
+            Values already in the encoder are retained, if they match.
+            """
+        try:
+            f = open(fileName)
+            lValues = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            return False
+        if lValues[:len(self.lValues)] != self.lValues:
+            print("WARN:CatEncoder:load:{}: codes dont match, ignoring".format(fileName))
+            return False
+        for sValue in lValues:
+            self.encode(sValue)
+        return True
+
+
+    def save(self, fileName):
+        tmpFileName = "{}.tmp".format(fileName)
+        f = open(tmpFileName, "w")
+        json.dump(self.lValues, f)
+        f.close()
+        os.replace(tmpFileName, fileName)
+
+
+
+def iter_chunks(itRows, chunkRows=None):
+    """ Group the rows got from the given iterator into lists of upto chunkRows
+        rows. If chunkRows is None, all the rows are returned as a single list.
+        """
+    lChunk = []
+    for lRow in itRows:
+        lChunk.append(lRow)
+        if (chunkRows != None) and (len(lChunk) >= chunkRows):
+            yield lChunk
+            lChunk = []
+    if len(lChunk) > 0:
+        yield lChunk
+
+
+
+def _merge_long2wide(wide, aSeen, aFlat, aVals, aggregate):
+    """ Scatter the given long format entries (flat cell index, value) into the
+        flat wide matrix, combining them with the values already in it (as noted
+        by the aSeen mask) as specified by aggregate. aSeen is updated.
+        """
+    if len(aFlat) == 0:
+        return
+    if aggregate in [ "last", "first" ]:
+        if aggregate == "last":
+            aFlatU, aPos = numpy.unique(aFlat[::-1], return_index=True)
+            aPos = len(aFlat) - 1 - aPos
+        else:
+            aFlatU, aPos = numpy.unique(aFlat, return_index=True)
+            aNew = ~aSeen[aFlatU]
+            aFlatU = aFlatU[aNew]
+            aPos = aPos[aNew]
+        wide[aFlatU] = aVals[aPos]
+    elif aggregate == "sum":
+        aFlatU, aInv = numpy.unique(aFlat, return_inverse=True)
+        aSum = numpy.bincount(aInv.reshape(-1), weights=aVals, minlength=len(aFlatU))
+        wide[aFlatU] = numpy.where(aSeen[aFlatU], wide[aFlatU], 0) + aSum
+    elif aggregate in [ "max", "min" ]:
+        if aggregate == "max":
+            theUFunc = numpy.maximum
+        else:
+            theUFunc = numpy.minimum
+        # Sort entries by cell and reduce each run of entries belonging to the same cell
+        aOrder = numpy.argsort(aFlat, kind="stable")
+        aFlatS = aFlat[aOrder]
+        aStarts = numpy.flatnonzero(numpy.r_[True, aFlatS[1:] != aFlatS[:-1]])
+        aFlatU = aFlatS[aStarts]
+        aRed = theUFunc.reduceat(aVals[aOrder], aStarts)
+        wide[aFlatU] = numpy.where(aSeen[aFlatU], theUFunc(wide[aFlatU], aRed), aRed)
+    else:
+        raise NotImplementedError("DataSrc:pivot_long2wide:aggregate:{}".format(aggregate))
+    aSeen[aFlat] = True
+
+
+
+def pivot_long2wide(aRowKeys, aColCodes, aVals, numCols=None, aggregate="last", fillValue=0, dtype=float):
+    """ Pivot the given long format data (rowKey, colCode, value) into a wide
+        matrix, using a single vectorised scatter.
+
+        aRowKeys: the row key (say date) of each entry. Each unique row key
+            becomes a row in the wide matrix, in sorted order.
+        aColCodes: the 0 based col index (say encoded geoId) of each entry.
+        aVals: the value of each entry.
+        numCols: the number of cols in the wide matrix. If None, it is derived
+            from aColCodes.
+        aggregate: how to handle multiple entries for the same row key and col.
+            "last": the last entry wins, "first": the first entry wins,
+            "sum", "max", "min": the entries are combined accordingly.
+        fillValue: the value used for cells without any entry.
+
+        Returns the sorted unique row keys and the wide matrix.
+        """
+    aUniqRowKeys, aRowIdx = numpy.unique(aRowKeys, return_inverse=True)
+    aRowIdx = aRowIdx.reshape(-1)
+    aColCodes = numpy.asarray(aColCodes, dtype=int)
+    aVals = numpy.asarray(aVals)
+    if numCols == None:
+        numCols = 0
+        if len(aColCodes) > 0:
+            numCols = aColCodes.max()+1
+    numRows = len(aUniqRowKeys)
+    wide = numpy.full(numRows*numCols, fillValue, dtype=dtype)
+    aSeen = numpy.zeros(numRows*numCols, dtype=bool)
+    _merge_long2wide(wide, aSeen, aRowIdx*numCols + aColCodes, aVals, aggregate)
+    return aUniqRowKeys, wide.reshape(numRows, numCols)
+
+
+
+def pivot_long2wide_chunked(fnChunks, numCols=None, aggregate="last", fillValue=0, dtype=float, colOffset=0):
+    """ Pivot long format data, which is got as a sequence of chunks, into a
+        wide matrix, similar to pivot_long2wide, but without ever holding the
+        full long data in memory.
+
+        fnChunks: a function which returns a fresh iterator of chunks, where each
+            chunk is a tuple of (aRowKeys, aColCodes, aVals) arrays. It is called
+            twice, 1st to find the unique row keys (and num of cols), 2nd to scatter
+            the chunks into the preallocated wide matrix.
+        numCols: the number of (data) cols in the wide matrix. If None, it is
+            derived from the col codes. It can also be a function, which is called
+            after the 1st pass, to get the same.
+        colOffset: the col codes are offset by this, so that the leading colOffset
+            cols (filled with fillValue) are free for use by the caller.
+
+        The peak memory used is that of the wide matrix (plus a bool mask of the
+        same shape) and one chunk.
+
+        Returns the sorted unique row keys and the wide matrix.
+        """
+    aUniqRowKeys = None
+    iMaxCol = -1
+    for aRowKeys, aColCodes, aVals in fnChunks():
+        if len(aRowKeys) == 0:
+            continue
+        if aUniqRowKeys is None:
+            aUniqRowKeys = numpy.unique(aRowKeys)
+        else:
+            aUniqRowKeys = numpy.union1d(aUniqRowKeys, aRowKeys)
+        iMaxCol = max(iMaxCol, numpy.max(aColCodes))
+    if numCols == None:
+        numCols = iMaxCol+1
+    elif callable(numCols):
+        numCols = numCols()
+    numCols += colOffset
+    if aUniqRowKeys is None:
+        aUniqRowKeys = numpy.empty(0)
+    numRows = len(aUniqRowKeys)
+    wide = numpy.full(numRows*numCols, fillValue, dtype=dtype)
+    aSeen = numpy.zeros(numRows*numCols, dtype=bool)
+    for aRowKeys, aColCodes, aVals in fnChunks():
+        aRowIdx = numpy.searchsorted(aUniqRowKeys, aRowKeys)
+        aFlat = aRowIdx*numCols + numpy.asarray(aColCodes, dtype=int) + colOffset
+        _merge_long2wide(wide, aSeen, aFlat, numpy.asarray(aVals), aggregate)
+    return aUniqRowKeys, wide.reshape(numRows, numCols)
+
+
+
+def fetch_all(lDataSrcs, day=None, month=None, year=None):
+    """ Fetch data for all the given data sources in parallel,
+        by calling their fetch_data.
+        """
+    with concurrent.futures.ThreadPoolExecutor(len(lDataSrcs)) as ex:
+        lFutures = []
+        for ds in lDataSrcs:
+            lFutures.append(ex.submit(ds.fetch_data, day, month, year))
+    for fut in lFutures:
+        fut.result()
 
 
 
@@ -307,117 +1715,339 @@ class Cov19InDataSrc(DataSrc):
         return float(self.conv_date_str2int(sDate, iY=2, iD=0, mType="abbr", bYear2Digit=True))
 
 
+    def conv_dates(self, aDates):
+        return self.conv_dates_str2int(aDates, iY=2, iD=0, mType="abbr", bYear2Digit=True).astype(float)
+
+
     def load_data(self, fileName=None, fixMissing=None):
         converters = { 0: lambda x: self.conv_date(x) }
+        colConverters = { 0: self.conv_dates }
         if fixMissing == None:
             fixMissing = { "type": "value", "missing": numpy.NAN, "value": 0 }
-        super().load_data(fileName=fileName, delimiter=",", skip_header=1, converters=converters, iHdrLine=0, fixMissing=fixMissing)
+        super().load_data(fileName=fileName, delimiter=",", skip_header=1, converters=converters, iHdrLine=0, fixMissing=fixMissing, colConverters=colConverters)
         # Remove the empty last column
         self.hdr = self.hdr[:-1]
         self.data = self.data[:,:-1]
 
 
 
-class EUWorldDataSrc(DataSrc):
-
-    #url="https://www.ecdc.europa.eu/sites/default/files/documents/COVID-19-geographic-disbtribution-worldwide-2020-03-20.xlsx"
-    nwFileNameFmt = "COVID-19-geographic-disbtribution-worldwide-{}-{:02}-{:02}.xlsx"
-    urlFmt = "https://www.ecdc.europa.eu/sites/default/files/documents/{}"
-    #localFileNameFmt = "data/{}-{}{:02}{:02}-{}"
-    localFileNameFmt = "data/{}-{}{:02}{:02}.xlsx"
+class LongDataSrc(DataSrc):
+    """ A generic data source for long format data, ie with a row per date and
+        region, which is pivoted into the date x region matrix expected by
+        AnalPlot.set_raw. The matrix has date as the 1st col, a Total2Calc col
+        (left as 0) and inturn a col per region.
+
+        It is configured (either using class variables in a child class or the
+        __init__ arguments) by
+        dateField, valueField, regionField: the names of the columns in the header
+            row, which contain the date, the value and the region id.
+        dateFmt: the arguments to pass to conv_date_str2int/conv_dates_str2int to
+            convert the date strings.
+        aggregate: how to handle multiple rows for the same date and region, one of
+            "last", "sum" or "max" (or "first", "min"), see pivot_long2wide.
+        chunkRows: if set, the long data is ingested in chunks of this many rows,
+            see pivot_long2wide_chunked.
+        nwFileNameFmt, urlFmt: the file name (formatted using year, month, day) and
+            url (formatted using the file name) to fetch the data from.
+
+        The long data could either be a csv file or a xlsx file. The region ids are
+        encoded using a CatEncoder, which is persisted, so that the region cols
+        remain in the same order across snapshots.
+        """
 
-    def __init__(self):
-        self.name = "EUWorld"
-        self.fields = [ "dateRep", "cases", "geoId" ]
-        self.geoIds = []
+    name = "Long"
+    dateField = "date"
+    valueField = "value"
+    regionField = "region"
+    dateFmt = { "delimiter": "-", "iY": 0, "iM": 1, "iD": 2, "mType": "int", "bYear2Digit": False }
+    aggregate = "last"
+    chunkRows = None
+    # The format used to save the values in the pivoted csv file
+    valueFmt = "%.10g"
+    nwFileNameFmt = None
+    urlFmt = "{}"
+    localFileNameFmt = "data/{}-{}{:02}{:02}-long{}"
+
+    def __init__(self, name=None, dateField=None, valueField=None, regionField=None, dateFmt=None, aggregate=None, chunkRows=None, nwFileNameFmt=None, urlFmt=None):
+        for sAttr, vValue in [ ("name", name), ("dateField", dateField), ("valueField", valueField), ("regionField", regionField),
+                                ("dateFmt", dateFmt), ("aggregate", aggregate), ("chunkRows", chunkRows),
+                                ("nwFileNameFmt", nwFileNameFmt), ("urlFmt", urlFmt) ]:
+            if vValue != None:
+                setattr(self, sAttr, vValue)
+        self.fields = [ self.dateField, self.valueField, self.regionField ]
+        self._set_regions(CatEncoder())
+
+
+    def _set_regions(self, enc):
+        """ Setup the region categorical encoder, regions is its list of values.
+            """
+        self.regionEnc = enc
+        self.regions = enc.lValues
 
 
     def _fix_url_filenames(self):
         self.nwFileName = self.nwFileNameFmt.format(self.fd_year, self.fd_month, self.fd_day)
         self.url = self.urlFmt.format(self.nwFileName)
-        self.localFileName = self.localFileNameFmt.format(self.name, self.fd_year, self.fd_month, self.fd_day)
-        # fetched file is xlsx and also needs postproc; Set to "xls"
-        self.localFileType = "xls"
+        (tBase, tExt) = os.path.splitext(self.nwFileName)
+        self.localFileName = self.localFileNameFmt.format(self.name, self.fd_year, self.fd_month, self.fd_day, tExt)
+        # fetched file needs to be pivoted into a matrix
+        if tExt.lower() in [ ".xls", ".xlsx" ]:
+            self.localFileType = "xls"
+        else:
+            self.localFileType = "long"
 
 
-    def conv_geoid(self, sGeoId):
-        try:
-            sGeoId = sGeoId.decode()
-            i = self.geoIds.index(sGeoId)
-        except ValueError:
-            self.geoIds.append(sGeoId)
-            i = len(self.geoIds) - 1
-        return i
+    def _convdata_filename(self):
+        if self.localFileType == "long":
+            (tBase, tExt) = os.path.splitext(self.localFileName)
+            return "{}-wide.csv".format(tBase)
+        return super()._convdata_filename()
+
+
+    def conv_data(self):
+        """ Over and above the types handled by DataSrc.conv_data, it handles
+                "long", ie a long format csv file, which is pivoted into a
+                separate csv file, using _fetchconv_postproc.
+            """
+        if self.localFileType == "long":
+            longFN = self.localFileName
+            self.localFileName = self._convdata_filename()
+            self.localFileType = "proc"
+            self._fetchconv_postproc(longFN)
+            return
+        super().conv_data()
+
+
+    def conv_region(self, sRegion):
+        return self.regionEnc.encode(sRegion)
 
 
-    def _fetchconv_postproc(self):
-        """ dumb, but simple for now
+    def conv_regions(self, aRegions):
+        """ Vectorised version of conv_region. New regions are added to the regions
+            list in the order in which they first appear in the given array.
             """
-        fIn = open(self.localFileName)
-        fOutName = "{}.tmp".format(self.localFileName)
-        fOut = open(fOutName, "w+")
-        for l in fIn:
-            if l.find('"') == -1:
-                fOut.write(l)
-                continue
-            fOut.write(replace_ifwithin(l, '"', ',', '_'))
-        fIn.close()
-        fOut.close()
-        os.rename(fOutName, self.localFileName)
-        hdr = self._load_hdr(self.localFileName, ",", 0)
-        cols = []
-        for i in self.fields:
-            cols.append(hdr.index(i))
-        cols = tuple(cols)
-        converters = { 0: lambda x: self.conv_date(x), cols[2]: lambda x: self.conv_geoid(x) }
-        print(cols)
-        super().load_data(fileName=self.localFileName, dtype=int, delimiter=",", skip_header=1, converters=converters, iHdrLine=0, usecols=cols)
-        minDate = self.data[:,0].min()
-        maxDate = self.data[:,0].max()
-        numRows = maxDate-minDate+1
-        numRows = len(numpy.unique(self.data[:,0]))
-        numCols = self.data[:,2].max()+1+2
-        #data = numpy.ones((numRows, numCols)) * numpy.nan
-        data = numpy.zeros((numRows, numCols))
-        iDate = 0
-        for date in numpy.arange(minDate, maxDate+1):
-            dateData = self.data[self.data[:,0] == date]
-            for cur in dateData:
-                data[iDate,0] = date
-                data[iDate,cur[2]+2] = cur[1]
-            if len(dateData) >= 1:
-                iDate += 1
-        print(minDate, maxDate)
-        self.olddata = self.data
-        self.hdr = [ "date", "Total2Calc" ] + self.geoIds
-        self.data = data
+        return self.regionEnc.encode_array(aRegions)
+
+
+    def conv_date(self, sDate):
+        return self.conv_date_str2int(sDate, **self.dateFmt)
+
+
+    def conv_dates(self, aDates):
+        return self.conv_dates_str2int(aDates, **self.dateFmt)
+
+
+    def _conv_long_rows(self, lRows, xr=None):
+        """ Convert the given rows of date, value and region values into arrays of
+            int dates (YYYYMMDD), values and region codes. The dates could be strings
+            or (if from the xlsx reader xr) spreadsheet date serials. Missing values
+            are treated as 0. Rows without a date are dropped.
+            """
+        numRows = len(lRows)
+        lRows = [ r for r in lRows if (r[0] != None) and (r[0] != "") ]
+        if len(lRows) != numRows:
+            print("WARN:DataSrc:{}:dropping {} rows without {}".format(self.name, numRows-len(lRows), self.dateField))
+            numRows = len(lRows)
+        aDates = numpy.empty(numRows, dtype=int)
+        aStrDate = numpy.array([ type(r[0]) == str for r in lRows ], dtype=bool)
+        if aStrDate.any():
+            aDates[aStrDate] = self.conv_dates(numpy.array([ r[0] for r in lRows if type(r[0]) == str ]))
+        if not aStrDate.all():
+            aSerials = numpy.array([ r[0] for r in lRows if type(r[0]) != str ], dtype=float)
+            aUniq, aInv = numpy.unique(aSerials, return_inverse=True)
+            aUDates = numpy.array([ xr.conv_date_serial2int(fSerial) for fSerial in aUniq ], dtype=int)
+            aDates[~aStrDate] = aUDates[aInv.reshape(-1)]
+        aValues = self._conv_numeric(numpy.array([ "" if r[1] == None else str(r[1]) for r in lRows ]), float)
+        aValues = numpy.nan_to_num(aValues)
+        aCodes = self.conv_regions(numpy.array([ "" if r[2] == None else str(r[2]) for r in lRows ]))
+        return aDates, aValues, aCodes
+
+
+    def _long_chunks(self, srcFileName=None, chunkRows=None):
+        """ A generator which returns the date, value and region fields of the long
+            format data, either from the given xlsx or csv file or else from the
+            csv file got by converting the xls file, as chunks of upto chunkRows rows.
+            Each chunk is a tuple of (aDates, aValues, aRegionCodes).
+            """
+        if srcFileName == None:
+            srcFileName = self.localFileName
+        print("INFO:DataSrc:Loading:{}".format(srcFileName))
+        xr = None
+        if XlsxReader.is_xlsx(srcFileName):
+            xr = XlsxReader(srcFileName)
+            itRows = xr.read_cols(self.fields)
+        else:
+            itRows = self._iter_csv_rows(srcFileName, self.fields)
+        for lRows in iter_chunks(itRows, chunkRows):
+            yield self._conv_long_rows(lRows, xr)
+
+
+    def _load_long(self, srcFileName=None):
+        """ Load the date, value and region fields of the long format data into
+            data, as a Nx3 matrix.
+            """
+        self.data = numpy.empty((0, 3))
+        for aDates, aValues, aCodes in self._long_chunks(srcFileName):
+            self.data = numpy.column_stack((aDates, aValues, aCodes))
+
+
+    def _fetchconv_postproc(self, srcFileName=None):
+        """ Load the date, value and region fields either from the given xlsx or
+            long csv file or else from the csv file got by converting the xls file
+            and inturn pivot them into a date x region matrix, which is saved into
+            the csv file (localFileName).
+
+            If chunkRows is set, then the long format data is read in chunks of
+            chunkRows rows and pivoted into the date x region matrix directly, so
+            that the long format data is never held fully in memory (and olddata
+            is not retained).
+            """
+        # Use the same region codes (i.e col order) as in the previous snapshots
+        self._set_regions(self.load_catencoder(self.regionField))
+        if self.chunkRows == None:
+            self._load_long(srcFileName)
+            numCols = len(self.regions)+2
+            aDates, wide = pivot_long2wide(self.data[:,0], self.data[:,2], self.data[:,1], numCols=numCols-2, aggregate=self.aggregate)
+            data = numpy.zeros((len(aDates), numCols))
+            data[:,0] = aDates
+            data[:,2:] = wide
+            self.olddata = self.data
+        else:
+            def long_chunks():
+                for aDates, aValues, aCodes in self._long_chunks(srcFileName, self.chunkRows):
+                    yield aDates, aCodes, aValues
+            aDates, data = pivot_long2wide_chunked(long_chunks, numCols=lambda: len(self.regions), aggregate=self.aggregate, colOffset=2)
+            data[:,0] = aDates
+            self.olddata = None
+        self.save_catencoder(self.regionField, self.regionEnc)
+        if len(aDates) > 0:
+            dprint("DBUG:DataSrc:%s:FetchConvPostProc:Dates %d to %d"%(self.name, int(aDates[0]), int(aDates[-1])))
+        self.hdr = [ "date", "Total2Calc" ] + self.regions
+        self.data = store_array(data, bIntIfIntegral=True)
         # Save to csv file
         fOutName = "{}.tmp2".format(self.localFileName)
         sHdr = ""
         for sCol in self.hdr:
             sHdr += "{},".format(sCol)
         sHdr = sHdr.rstrip(',')
-        numpy.savetxt(fOutName, self.data, delimiter=",", header=sHdr, comments="", fmt="%d")
+        lFmt = [ "%d", "%d" ] + [ self.valueFmt ]*len(self.regions)
+        numpy.savetxt(fOutName, self.data, delimiter=",", header=sHdr, comments="", fmt=lFmt)
         os.rename(fOutName, self.localFileName)
 
 
-    def conv_date(self, sDate):
-        iDate = self.conv_date_str2int(sDate, delimiter="/", iY=2, iD=0, iM=1, mType="int", bYear2Digit=False)
-        fDate = float(iDate)
-        #print(sDate, fDate)
-        return iDate
-
-
     def load_data(self, fileName=None, fixMissing=None):
         if fixMissing == None:
             fixMissing = { "type": "value", "missing": numpy.NAN, "value": 0 }
         super().load_data(fileName=fileName, delimiter=",", skip_header=1, iHdrLine=0, fixMissing=fixMissing)
+        self._set_regions(CatEncoder([ sId.strip() for sId in self.hdr[2:] ]))
+
+
+
+class EUWorldDataSrc(LongDataSrc):
+
+    #url="https://www.ecdc.europa.eu/sites/default/files/documents/COVID-19-geographic-disbtribution-worldwide-2020-03-20.xlsx"
+    nwFileNameFmt = "COVID-19-geographic-disbtribution-worldwide-{}-{:02}-{:02}.xlsx"
+    urlFmt = "https://www.ecdc.europa.eu/sites/default/files/documents/{}"
+    #localFileNameFmt = "data/{}-{}{:02}{:02}-{}"
+    localFileNameFmt = "data/{}-{}{:02}{:02}.xlsx"
+    # The xlsx for a given date doesnt change normally
+    cacheTTL = 24*60*60
+    name = "EUWorld"
+    dateField = "dateRep"
+    valueField = "cases"
+    regionField = "geoId"
+    dateFmt = { "delimiter": "/", "iY": 2, "iD": 0, "iM": 1, "mType": "int", "bYear2Digit": False }
+    valueFmt = "%d"
+
+    def _set_regions(self, enc):
+        """ The regions are geoIds in this case.
+            """
+        super()._set_regions(enc)
+        self.geoIdEnc = enc
+        self.geoIds = self.regions
+
+
+    def _fix_url_filenames(self):
+        self.nwFileName = self.nwFileNameFmt.format(self.fd_year, self.fd_month, self.fd_day)
+        self.url = self.urlFmt.format(self.nwFileName)
+        self.localFileName = self.localFileNameFmt.format(self.name, self.fd_year, self.fd_month, self.fd_day)
+        # fetched file is xlsx and also needs postproc; Set to "xls"
+        self.localFileType = "xls"
+
+
+    def conv_geoid(self, sGeoId):
+        return self.conv_region(sGeoId)
+
+
+    def conv_geoids(self, aGeoIds):
+        return self.conv_regions(aGeoIds)
+
+
+    def load_data(self, fileName=None, fixMissing=None):
+        super().load_data(fileName=fileName, fixMissing=fixMissing)
         dprint("DBUG:DataSrc:EU:load_data:hdr-type:%s" %(type(self.hdr[-2])))
 
 
 
+def test_downloader():
+    """ Check the in-process downloader (and DataSrc.download) against a local
+        http.server stand-in, for a full download (200), a conditional GET which
+        skips the transfer (304), keep-alive connection reuse and url probing.
+        """
+    global gDownloadCache
+    import http.server
+    import tempfile
+    import functools
+    tmpDir = tempfile.mkdtemp()
+    srvDir = os.path.join(tmpDir, "srv")
+    os.makedirs(srvDir)
+    f = open(os.path.join(srvDir, "data.csv"), "w")
+    f.write("date,cases\n" + "20200501,10\n"*1024)
+    f.close()
+    lConns = []
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def setup(self):
+            lConns.append(self.client_address)
+            super().setup()
+        def log_message(self, *args):
+            pass
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=srvDir))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    theUrl = "http://127.0.0.1:{}/data.csv".format(srv.server_address[1])
+    oldCache = gDownloadCache
+    gDownloadCache = DownloadCache(os.path.join(tmpDir, "cache"))
+    try:
+        dl = HttpDownloader()
+        localFileName = os.path.join(tmpDir, "data.csv")
+        bModified, etag, lastModified = dl.get(theUrl, localFileName)
+        assert bModified and (hash_file(localFileName) == hash_file(os.path.join(srvDir, "data.csv")))
+        assert lastModified != None
+        iMTime = os.stat(localFileName).st_mtime_ns
+        bModified, etag, lastModified = dl.get(theUrl, localFileName, etag, lastModified)
+        assert (not bModified) and (os.stat(localFileName).st_mtime_ns == iMTime)
+        assert dl.probe(theUrl) and (not dl.probe(theUrl+".missing"))
+        assert len(lConns) == 1, "Connection not reused:{}".format(lConns)
+        dl.close()
+        ds = DataSrc()
+        localFileName = os.path.join(tmpDir, "ds.csv")
+        assert ds.download(theUrl, localFileName)
+        assert not ds.download(theUrl, localFileName, bConditional=True)
+        print("INFO:DataSrc:test_downloader: passed ({} connections)".format(len(lConns)))
+    finally:
+        gDownloadCache = oldCache
+        srv.shutdown()
+        srv.server_close()
+        shutil.rmtree(tmpDir)
+
+
+
 if __name__ == "__main__":
 
+    if (len(sys.argv) > 1) and (sys.argv[1] == "--test_downloader"):
+        test_downloader()
+        sys.exit()
+
     import matplotlib.pyplot as plt
 
     for theDataSrc in [ Cov19InDataSrc(), EUWorldDataSrc()]:
@@ -3,6 +3,9 @@
 # v20200430IST1725, HanishKVC
 #
 
+import numpy
+
+
 GLOBAL_DBGLEVEL=10
 def dprint(sMsg, dbgLvl=GLOBAL_DBGLEVEL):
     """ dprint the given msg if its dbgLvl is
@@ -14,15 +17,56 @@ def dprint(sMsg, dbgLvl=GLOBAL_DBGLEVEL):
 
 
 def replace_ifwithin(lIn, withIn='"', find=',', replace='_'):
-    bWithIn = False
-    lOut = ""
-    for c in lIn:
-        if c == withIn:
-            bWithIn = not bWithIn
-        if bWithIn and (c == find):
-            c = replace
-        lOut += c
-    return lOut
+    """ replace find with replace, if it is within a pair of withIn chars.
+        The odd parts got by splitting on withIn are the ones within.
+        """
+    lParts = lIn.split(withIn)
+    for i in range(1, len(lParts), 2):
+        lParts[i] = lParts[i].replace(find, replace)
+    return withIn.join(lParts)
+
+
+
+
+# The dtype policy used to store data (loaded data as well as dataOp results)
+#   "default": use the dtype got from numpy as is (ie float64 / int64 normally)
+#   "compact": store integral data as int32 and other float data as float32
+DTYPE_POLICY="default"
+def set_dtype_policy(policy="default"):
+    """ Set the dtype policy used to store data, "default" or "compact"
+        """
+    global DTYPE_POLICY
+    if policy not in [ "default", "compact" ]:
+        raise NotImplementedError("helpers:set_dtype_policy:{}".format(policy))
+    DTYPE_POLICY = policy
+
+
+def get_dtype_policy():
+    return DTYPE_POLICY
+
+
+def store_array(a, bIntIfIntegral=False):
+    """ Return the given array in the dtype to use for storing it, as per
+        the current dtype policy. In compact mode
+            signed ints are stored as int32, if their values fit in int32
+            floats are stored as float32, unless bIntIfIntegral is True and
+                all the values are integral and fit in int32, in which case
+                they are stored as int32 (say case counts, dates).
+        """
+    if DTYPE_POLICY == "default":
+        return a
+    iInfo = numpy.iinfo(numpy.int32)
+    if numpy.issubdtype(a.dtype, numpy.signedinteger):
+        if (a.dtype.itemsize > 4) and ((a.size == 0) or ((a.min() >= iInfo.min) and (a.max() <= iInfo.max))):
+            return a.astype(numpy.int32)
+        return a
+    if numpy.issubdtype(a.dtype, numpy.floating):
+        if bIntIfIntegral and (a.size > 0):
+            if numpy.all(numpy.isfinite(a)) and (a.min() >= iInfo.min) and (a.max() <= iInfo.max) and numpy.all(a == numpy.trunc(a)):
+                return a.astype(numpy.int32)
+        if a.dtype.itemsize > 4:
+            return a.astype(numpy.float32)
+    return a
 
 
 
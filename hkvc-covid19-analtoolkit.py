@@ -15,8 +15,8 @@ from helpers import *
 def fetch():
     dsEU = dsrc.EUWorldDataSrc()
     dsC19In = dsrc.Cov19InDataSrc()
+    dsrc.fetch_all([ dsC19In, dsEU ])
     for ds in [ dsC19In, dsEU ]:
-        ds.fetch_data()
         ds.load_data()
     return [ dsEU, dsC19In ]
 
@@ -248,7 +248,9 @@ def processargs_sel(args, iArg):
     return iArg, key, ids
 
 
+sDISKCACHE_DIR=None
 def processargs_and_load(args):
+    global sDISKCACHE_DIR
     global bMODE_SCALEDIFF
     global bTEST_MIXMATCH
     global sPLOTXY_GSTYPE
@@ -291,6 +293,10 @@ def processargs_and_load(args):
         elif args[iArg] == "--plotsel_partial":
             bPLOTSEL_PARTIAL = True
             iArg += 1
+        elif args[iArg] == "--diskcache":
+            iArg += 1
+            sDISKCACHE_DIR = args[iArg]
+            iArg += 1
         else:
             print("ERRR:Main:load_fromargs:UnknownArg:%s"%(args[iArg]))
             iArg += 1
@@ -302,7 +308,7 @@ allDS, allSel = processargs_and_load(sys.argv)
 if len(allDS) == 0:
     allDS = fetch()
 
-ap = analplot.AnalPlot()
+ap = analplot.AnalPlot(diskCacheDir=sDISKCACHE_DIR)
 #plot_simple(allDS)
 plot_sel(allDS, allSel)
 if bTEST_MIXMATCH: